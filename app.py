@@ -1,81 +1,429 @@
 import flet as ft
+from storage import Storage
+from hub import ClubHub
+from diagnostics import PROFILER, StartupTimer
+from applog import setup_logging
+from billing import TARIFFS, format_money
+from state import StaleReceipt, TableState, TableStatus
+from inventory import StockItem
+import abc
+import asyncio
+import bisect
 import datetime
-import time
-import random
+import functools
 import math
 import logging
+import os
+import threading
 from typing import Optional
-from enum import Enum
+from types import MappingProxyType
+import numpy as np
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='billiard_app.log'
+# Ассеты (шрифты) лежат рядом с приложением: клубные компьютеры часто без интернета
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+FONT_FAMILY = "Roboto"
+# Жирное начертание - отдельным семейством: page.fonts сопоставляет семейству один файл
+FONT_FAMILY_BOLD = "Roboto Bold"
+FONTS = {FONT_FAMILY: "fonts/Roboto-Regular.ttf", FONT_FAMILY_BOLD: "fonts/Roboto-Bold.ttf"}
+
+# Цены каталога в рублях; склад переводит их в копейки при загрузке
+DEFAULT_PRODUCTS = (
+    {"name": "Пиво", "price": 150.00, "stock": 24, "category": "Алкоголь"},
+    {"name": "Кола", "price": 80.00, "stock": 36, "category": "Напитки"},
+    {"name": "Вода", "price": 50.00, "stock": 48, "category": "Напитки"},
+    {"name": "Чипсы", "price": 120.00, "stock": 20, "category": "Закуски"},
+    {"name": "Кофе", "price": 90.00, "stock": 30, "category": "Напитки"},
+    {"name": "Чай", "price": 60.00, "stock": 40, "category": "Напитки"},
+    {"name": "Бургер", "price": 180.00, "stock": 15, "category": "Закуски"},
+    {"name": "Вино", "price": 250.00, "stock": 12, "category": "Алкоголь"},
 )
 
-class TableStatus(Enum):
-    AVAILABLE = "Свободен"
-    OCCUPIED = "Занят"
-    MAINTENANCE = "Обслуживание"
-    RESERVED = "Бронь"
+class UpdateBatcher:
+    """Собирает изменённые контролы и отправляет их одним обновлением за кадр.
+
+    Обработчики вызывают mark_dirty() вместо control.update()/page.update();
+    все пометки, сделанные в пределах окна кадра, уходят клиенту одним патчем.
+    """
+
+    MIN_WINDOW = 0.016
+    MAX_WINDOW = 0.1
+
+    def __init__(self, page: ft.Page, window: float = 0.033):
+        self.page = page
+        self.window = min(max(window, self.MIN_WINDOW), self.MAX_WINDOW)
+        self._dirty = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+        # Фоновые изменения UI (тики, дельты других сессий) и отправка патча
+        # не перемешиваются: пока дерево обходится для патча, его не меняют
+        self.ui_lock = threading.RLock()
+
+    def mark_dirty(self, *controls):
+        PROFILER.count_marks(len(controls))
+        with self._lock:
+            for control in controls:
+                self._dirty[id(control)] = control
+            if self._scheduled or not self._dirty:
+                return
+            self._scheduled = True
+        self.page.run_task(self._flush_later)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        # Цикл событий общий для всех сессий: UI-блокировку ждём в пуле потоков, а не в нём
+        self.page.run_thread(self._flush_pending)
+
+    def _flush_pending(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Error flushing UI updates: {e}")
+
+    def flush(self):
+        with self.ui_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            controls = list(self._dirty.values())
+            self._dirty.clear()
+            self._scheduled = False
+        if any(c is self.page for c in controls):
+            # Обновление страницы само находит все изменения в дереве
+            with PROFILER.measure("flush"):
+                self.page.update()
+            PROFILER.record_flush(len(controls))
+            return
+        # Контролы, ещё не добавленные на страницу, уйдут вместе с родителем
+        controls = [c for c in controls if c.page is not None]
+        if controls:
+            with PROFILER.measure("flush"):
+                self.page.update(*controls)
+            PROFILER.record_flush(len(controls))
+
+def ui_handler(func):
+    """Точка входа обработчика Flet: выполняется под UI-блокировкой сессии.
+
+    Синхронные обработчики Flet запускает в пуле потоков, поэтому без
+    блокировки клик менял бы дерево, пока тик или дельта отправляют патч.
+    Блокировка повторно входимая: обработчики могут вызывать друг друга.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        app = getattr(self, "app", self)
+        with app.batcher.ui_lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+class HoverCoalescer:
+    """Серверный hover с прореживанием событий.
+
+    Обработчик on_hover только запоминает последнее состояние контрола.
+    Через delay применяются итоговые состояния: если курсор пересёк карточку
+    (вход и выход внутри окна), итог совпадает с текущим видом и событие
+    отбрасывается без обновления. Контрол должен иметь атрибут hovered и
+    метод apply_hover(hovered).
+    """
+
+    def __init__(self, page: ft.Page, batcher: UpdateBatcher, delay: float = 0.08):
+        self.page = page
+        self.batcher = batcher
+        self.delay = delay
+        self.dropped = 0
+        self._pending = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def hover(self, control, hovered: bool):
+        with self._lock:
+            self._pending[id(control)] = (control, hovered)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.page.run_task(self._apply_later)
+
+    async def _apply_later(self):
+        await asyncio.sleep(self.delay)
+        self.page.run_thread(self._apply_pending)
+
+    def _apply_pending(self):
+        try:
+            self.apply()
+        except Exception as e:
+            logging.error(f"Error applying hover states: {e}")
+
+    def apply(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._scheduled = False
+        changed = [(control, hovered) for control, hovered in pending if control.hovered != hovered]
+        self.dropped += len(pending) - len(changed)
+        if not changed:
+            return
+        with self.batcher.ui_lock:
+            with PROFILER.measure("hover:apply"):
+                for control, hovered in changed:
+                    control.hovered = hovered
+                    control.apply_hover(hovered)
+            # Hover уже задержан на delay, поэтому не ждём ещё и окна батчера
+            self.batcher.flush()
+
+class TickScheduler:
+    """Задачи тиков одной сессии.
+
+    Задачи подписываются на каждый N-й тик и помечают изменённые контролы
+    в батчере, а в конце тика всё накопленное отправляется одним обновлением.
+    Сам цикл один на процесс и принадлежит ClubHub.
+    """
+
+    def __init__(self, hub, batcher: UpdateBatcher):
+        self.hub = hub
+        self.batcher = batcher
+        self.skipped = 0
+        self._jobs = []
+        self._running = False
+
+    def every(self, ticks: int, callback):
+        self._jobs.append((ticks, callback))
+
+    def start(self):
+        self.hub.add_ticker(self)
+
+    def stop(self):
+        self.hub.remove_ticker(self)
+
+    def tick(self, tick_count: int, now: datetime.datetime):
+        # Вызывается в общем цикле событий: работа под UI-блокировкой уходит в пул потоков.
+        # Пока предыдущий тик ждёт долгий обработчик этой сессии, новые пропускаются
+        if self._running:
+            self.skipped += 1
+            return
+        self._running = True
+        self.batcher.page.run_thread(self._run_tick, tick_count, now)
+
+    def _run_tick(self, tick_count: int, now: datetime.datetime):
+        try:
+            with self.batcher.ui_lock:
+                self._tick(tick_count, now)
+        finally:
+            self._running = False
+
+    def _tick(self, tick_count: int, now: datetime.datetime):
+        for ticks, callback in self._jobs:
+            if tick_count % ticks == 0:
+                try:
+                    with PROFILER.measure(f"tick:{callback.__name__}"):
+                        callback(now)
+                except Exception as e:
+                    logging.error(f"Error in tick job {callback.__name__}: {e}")
+        try:
+            self.batcher.flush()
+        except Exception as e:
+            logging.error(f"Error flushing tick updates: {e}")
+
+class Palette:
+    """Общая палитра стилей для всех виджетов.
+
+    Рамки, тени, градиенты, анимации и стили кнопок создаются один раз и
+    разделяются всеми столами и карточками. Объекты палитры считаются
+    неизменяемыми: чтобы сменить стиль, контролу присваивают другой объект.
+    """
+
+    STATUS_COLORS = MappingProxyType({
+        TableStatus.AVAILABLE: ft.colors.with_opacity(0.8, "#4CAF50"),
+        TableStatus.OCCUPIED: ft.colors.with_opacity(0.8, "#FF9800"),
+        TableStatus.MAINTENANCE: ft.colors.with_opacity(0.8, "#F44336"),
+        TableStatus.RESERVED: ft.colors.with_opacity(0.8, "#2196F3")
+    })
+
+    EASE_300 = ft.Animation(300, ft.AnimationCurve.EASE_IN_OUT)
+    EASE_200 = ft.Animation(200, ft.AnimationCurve.EASE_IN_OUT)
+
+    # Стол
+    TABLE_GRADIENT = ft.LinearGradient(
+        begin=ft.alignment.top_left,
+        end=ft.alignment.bottom_right,
+        colors=[ft.colors.with_opacity(0.7, "#8B4513"), ft.colors.with_opacity(0.9, "#5D4037")]
+    )
+    TABLE_SHADOW = ft.BoxShadow(
+        spread_radius=1,
+        blur_radius=15,
+        color=ft.colors.with_opacity(0.3, "#000000"),
+        offset=ft.Offset(0, 0),
+        blur_style=ft.ShadowBlurStyle.NORMAL,
+    )
+    FELT_GRADIENT = ft.LinearGradient(
+        begin=ft.alignment.top_left,
+        end=ft.alignment.bottom_right,
+        colors=["#2E7D32", "#1B5E20"]
+    )
+    FELT_SHADOW = ft.BoxShadow(spread_radius=0, blur_radius=10, color=ft.colors.with_opacity(0.2, "#000000"))
+    BADGE_SHADOW = ft.BoxShadow(spread_radius=0, blur_radius=10, color=ft.colors.with_opacity(0.3, "#000000"))
+    POCKET_SHADOW = ft.BoxShadow(spread_radius=0, blur_radius=5, color=ft.colors.with_opacity(0.5, "#000000"))
+
+    TABLE_INK = ft.colors.with_opacity(0.15, "#3498DB")
+
+    # Карточка товара
+    CARD_BGCOLOR = ft.colors.with_opacity(0.8, "#424242")
+    CARD_BGCOLOR_HOVER = ft.colors.with_opacity(0.9, "#616161")
+    CARD_SHADOW = ft.BoxShadow(spread_radius=0, blur_radius=10, color=ft.colors.with_opacity(0.2, "#000000"))
+    CARD_ICON_BGCOLOR = ft.colors.with_opacity(0.2, "#616161")
+    CARD_BUTTON_STYLE = ft.ButtonStyle(
+        padding=ft.Padding(0, 0, 0, 0),
+        bgcolor={"": ft.colors.with_opacity(0.8, "#42A5F5"), "hovered": ft.colors.with_opacity(1, "#1E88E5")},
+        shape=ft.RoundedRectangleBorder(radius=10),
+        animation_duration=200,
+        overlay_color=ft.colors.with_opacity(0.1, "#FFFFFF")
+    )
+
+    # Плашка пользователя в шапке: hover обрабатывается клиентом по состоянию кнопки
+    NAVBAR_USER_STYLE = ft.ButtonStyle(
+        bgcolor={"": ft.colors.with_opacity(0.4, "#424242"), "hovered": ft.colors.with_opacity(0.6, "#424242")},
+        color="white",
+        shape=ft.StadiumBorder(),
+        side=ft.BorderSide(1, ft.colors.with_opacity(0.1, "#FFFFFF")),
+        padding=ft.padding.symmetric(horizontal=16),
+        animation_duration=300,
+        overlay_color=ft.colors.TRANSPARENT,
+    )
+
+    # Остаток на карточке товара
+    STOCK_OK = "#BDBDBD"
+    STOCK_LOW = "#FFA726"
+    STOCK_EMPTY = "#EF5350"
+
+    # Тепловая карта отчётов: 10 ступеней яркости, чтобы одинаковые доли давали одинаковый цвет
+    HEAT_LEVELS = 10
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def heat(cls, level: int) -> str:
+        return ft.colors.with_opacity(0.06 + 0.94 * level / cls.HEAT_LEVELS, "#4CAF50")
+
+    # Фильтры бара и отчётов. Стиль общий для всех кнопок, поэтому цвета живут в нём самом:
+    # bgcolor/color кнопки ElevatedButton при обновлении переписал бы в общий стиль
+    FILTER_STYLE_ACTIVE = ft.ButtonStyle(
+        color="white",
+        bgcolor={"": "#42A5F5", "hovered": "#1E88E5"},
+        shape=ft.RoundedRectangleBorder(radius=10),
+        padding=ft.Padding(20, 0, 20, 0),
+        animation_duration=200
+    )
+    FILTER_STYLE_INACTIVE = ft.ButtonStyle(
+        color="white",
+        bgcolor={"": ft.colors.with_opacity(0.3, "#424242"), "hovered": ft.colors.with_opacity(0.5, "#424242")},
+        shape=ft.RoundedRectangleBorder(radius=10),
+        padding=ft.Padding(20, 0, 20, 0),
+        animation_duration=200
+    )
+
+    @classmethod
+    def filter_style(cls, active: bool) -> ft.ButtonStyle:
+        return cls.FILTER_STYLE_ACTIVE if active else cls.FILTER_STYLE_INACTIVE
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def border(width: float, color: str) -> ft.Border:
+        return ft.border.all(width, color)
+
+    @classmethod
+    def table_border(cls, selected: bool = False, hovered: bool = False) -> ft.Border:
+        if selected:
+            return cls.border(3, "#3498DB")
+        return cls.border(2, "#3498DB" if hovered else "#5D4037")
+
+    @classmethod
+    def card_border(cls, hovered: bool = False) -> ft.Border:
+        return cls.border(1, ft.colors.with_opacity(0.8, "#42A5F5") if hovered else ft.colors.with_opacity(0.3, "#616161"))
+
+def format_duration(seconds: float) -> str:
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+def parse_window(day: str, start: str, end: str) -> tuple:
+    """Окно брони из полей формы (ДД.ММ.ГГГГ, ЧЧ:ММ); конец раньше начала - это следующие сутки."""
+    date = datetime.datetime.strptime(day.strip(), "%d.%m.%Y").date()
+    begin = datetime.datetime.combine(date, datetime.datetime.strptime(start.strip(), "%H:%M").time())
+    finish = datetime.datetime.combine(date, datetime.datetime.strptime(end.strip(), "%H:%M").time())
+    if finish <= begin:
+        finish += datetime.timedelta(days=1)
+    return begin, finish
 
 class BilliardTable(ft.Container):
-    def __init__(self, app, number: int, status: TableStatus = TableStatus.AVAILABLE, **kwargs):
+    status_colors = Palette.STATUS_COLORS
+    
+    def __init__(self, app, **kwargs):
         super().__init__(**kwargs)
         self.app = app
-        self.number = number
-        self.status = status
+        self.model = None
         self.width = 180
         self.height = 180
         self.border_radius = 12
         self.drag_interval = 10
-        self.animate = ft.Animation(300, ft.AnimationCurve.EASE_IN_OUT)
-        self.on_hover = self.hover_animation
+        self.animate = Palette.EASE_300
+        self.hovered = False
+        if app.hover_mode == "client":
+            # Подсветку при наведении рисует сам клиент, сервер о hover не узнаёт
+            self.ink = True
+            self.ink_color = Palette.TABLE_INK
+        else:
+            self.on_hover = self.hover_animation
         self.on_click = self.select_table
-        self.client_name = ""
-        self.start_time = None
-        self.current_tariff = 10  # 10 руб за минуту
-        self.products = []
-        self.selected = False
-        
-        self.status_colors = {
-            TableStatus.AVAILABLE: ft.colors.with_opacity(0.8, "#4CAF50"),
-            TableStatus.OCCUPIED: ft.colors.with_opacity(0.8, "#FF9800"),
-            TableStatus.MAINTENANCE: ft.colors.with_opacity(0.8, "#F44336"),
-            TableStatus.RESERVED: ft.colors.with_opacity(0.8, "#2196F3")
-        }
-        
-        self.bgcolor = ft.colors.with_opacity(0.9, "#8B4513")
-        self.border = ft.border.all(2, "#5D4037")
-        self.gradient = ft.LinearGradient(
-            begin=ft.alignment.top_left,
-            end=ft.alignment.bottom_right,
-            colors=[ft.colors.with_opacity(0.7, "#8B4513"), ft.colors.with_opacity(0.9, "#5D4037")]
-        )
-        self.shadow = ft.BoxShadow(
-            spread_radius=1,
-            blur_radius=15,
-            color=ft.colors.with_opacity(0.3, "#000000"),
-            offset=ft.Offset(0, 0),
-            blur_style=ft.ShadowBlurStyle.NORMAL,
-        )
+        
+        # Фон задаётся градиентом, отдельный bgcolor под ним не нужен
+        self.border = Palette.table_border()
+        self.gradient = Palette.TABLE_GRADIENT
+        self.shadow = Palette.TABLE_SHADOW
         self.content = self._create_table_content()
     
+    @property
+    def number(self) -> Optional[int]:
+        return self.model.number if self.model else None
+    
     def _create_table_content(self):
         # Создаем элементы управления, которые будем обновлять
         self.status_text = ft.Text(
-            self.status.value,
+            "",
             size=14,
-            color=self.status_colors[self.status],
-            weight=ft.FontWeight.BOLD
+            weight=ft.FontWeight.BOLD,
+            font_family=FONT_FAMILY_BOLD
         )
         
         self.time_text = ft.Text(
             "00:00:00",
             size=12,
+            color="white",
+            visible=False
+        )
+        
+        self.cost_text = ft.Text(
+            "",
+            size=11,
+            color="#A5D6A7",
+            visible=False
+        )
+        
+        self.number_text = ft.Text(
+            "",
+            size=18,
+            weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD,
             color="white"
-        ) if self.status == TableStatus.OCCUPIED else ft.Container()
+        )
+        
+        self.number_badge = ft.Container(
+            width=40,
+            height=40,
+            border_radius=20,
+            alignment=ft.alignment.center,
+            left=70,
+            top=50,
+            content=self.number_text,
+            animate_opacity=Palette.EASE_300,
+            shadow=Palette.BADGE_SHADOW
+        )
         
         return ft.Stack(
             [
@@ -83,52 +431,24 @@ class BilliardTable(ft.Container):
                 ft.Container(
                     width=160,
                     height=120,
-                    bgcolor="#2E7D32",
                     border_radius=10,
-                    border=ft.border.all(2, "#1B5E20"),
+                    border=Palette.border(2, "#1B5E20"),
                     top=10,
                     left=10,
-                    gradient=ft.LinearGradient(
-                        begin=ft.alignment.top_left,
-                        end=ft.alignment.bottom_right,
-                        colors=["#2E7D32", "#1B5E20"]
-                    ),
-                    shadow=ft.BoxShadow(
-                        spread_radius=0,
-                        blur_radius=10,
-                        color=ft.colors.with_opacity(0.2, "#000000"),
-                    )
+                    gradient=Palette.FELT_GRADIENT,
+                    shadow=Palette.FELT_SHADOW
                 ),
                 # Лузы
                 *[self._create_pocket(x, y) for x, y in [(10,10), (144,10), (10,110), (144,110)]],
                 # Номер стола
-                ft.Container(
-                    width=40,
-                    height=40,
-                    bgcolor=self.status_colors[self.status],
-                    border_radius=20,
-                    alignment=ft.alignment.center,
-                    left=70,
-                    top=50,
-                    content=ft.Text(
-                        f"{self.number}",
-                        size=18,
-                        weight=ft.FontWeight.BOLD,
-                        color="white"
-                    ),
-                    animate_opacity=ft.Animation(300, ft.AnimationCurve.EASE_IN_OUT),
-                    shadow=ft.BoxShadow(
-                        spread_radius=0,
-                        blur_radius=10,
-                        color=ft.colors.with_opacity(0.3, "#000000"),
-                    )
-                ),
+                self.number_badge,
                 # Статус и время
                 ft.Container(
                     content=ft.Column(
                         [
                             self.status_text,
-                            self.time_text
+                            self.time_text,
+                            self.cost_text
                         ],
                         spacing=2,
                         horizontal_alignment=ft.CrossAxisAlignment.CENTER
@@ -152,63 +472,457 @@ class BilliardTable(ft.Container):
             border_radius=8,
             left=left,
             top=top,
-            shadow=ft.BoxShadow(
-                spread_radius=0,
-                blur_radius=5,
-                color=ft.colors.with_opacity(0.5, "#000000"),
-            )
+            shadow=Palette.POCKET_SHADOW
         )
     
+    def bind(self, model: Optional[TableState]):
+        self.model = model
+        self.visible = model is not None
+        if model is not None:
+            self.number_text.value = f"{model.number}"
+            self.update_status_display()
+    
+    @PROFILER.instrument("hover_animation")
     def hover_animation(self, e):
-        self.scale = 1.03 if e.data == "true" else 1
-        self.border = ft.border.all(2, "#3498DB" if e.data == "true" else "#5D4037")
-        self.update()
+        self.app.hover.hover(self, e.data == "true")
+    
+    def apply_hover(self, hovered: bool):
+        self.scale = 1.03 if hovered else 1
+        if self.model is not None:
+            self.border = Palette.table_border(selected=self.model.number in self.app.selected_tables, hovered=hovered)
+        self.app.batcher.mark_dirty(self)
     
+    @ui_handler
     def select_table(self, e):
-        for table in self.app.tables:
-            table.selected = False
-            table.border = ft.border.all(2, "#5D4037")
-            table.update()
-        
-        self.selected = True
-        self.border = ft.border.all(3, "#3498DB")
-        self.update()
-        self.app.update_table_info(self)
+        if self.model is not None:
+            # Виджет мог не успеть перерисоваться: берём стол из текущего снимка
+            self.app.select_table(self.app.tables.get(self.model.number) or self.model)
     
     def update_status_display(self):
-        self.status_text.value = self.status.value
-        self.status_text.color = self.status_colors[self.status]
+        model = self.model
+        self.border = Palette.table_border(selected=model.number in self.app.selected_tables, hovered=self.hovered)
+        self.status_text.value = model.status.value
+        self.status_text.color = self.status_colors[model.status]
+        self.number_badge.bgcolor = self.status_colors[model.status]
         
-        if self.status == TableStatus.OCCUPIED:
-            if not isinstance(self.time_text, ft.Text):
-                self.time_text = ft.Text("00:00:00", size=12, color="white")
-        else:
-            if isinstance(self.time_text, ft.Text):
-                self.time_text = ft.Container()
+        running = model.status == TableStatus.OCCUPIED and model.start_time is not None
+        reservation = model.reservation if model.status == TableStatus.RESERVED else None
+        self.time_text.visible = running or reservation is not None
+        self.cost_text.visible = running or reservation is not None
+        if running:
+            self.render_timer(datetime.datetime.now())
+        elif reservation is not None:
+            self.time_text.value = f"{reservation.start:%H:%M}-{reservation.end:%H:%M}"
+            self.cost_text.value = reservation.customer
+    
+    def render_timer(self, now: datetime.datetime) -> list:
+        """Пересчитывает время и стоимость сессии; возвращает только изменившиеся подписи."""
+        model = self.model
+        changed = []
+        elapsed = format_duration((now - model.start_time).total_seconds())
+        if self.time_text.value != elapsed:
+            self.time_text.value = elapsed
+            changed.append(self.time_text)
+        cost = format_money(model.time_cost(now) + model.order_total)
+        if self.cost_text.value != cost:
+            self.cost_text.value = cost
+            changed.append(self.cost_text)
+        return changed
+
+class TableBoard:
+    """Виртуализированная доска столов.
+
+    Доска хранит только порядок номеров столов. Виджеты BilliardTable
+    существуют для видимых рядов (плюс запас) и при прокрутке или изменении
+    стола перепривязываются к его снимку из реестра. Ряды выше и ниже
+    окна заменены распорками нужной высоты, поэтому полоса прокрутки
+    соответствует полной доске.
+    """
+
+    TILE = 180
+    SPACING = 20
+    ROW_PITCH = TILE + SPACING
+    OVERSCAN_ROWS = 1
+
+    def __init__(self, app):
+        self.app = app
+        self.numbers = []
+        self.columns = 4
+        self.first_row = 0
+        self.scroll_offset = 0.0
+        self.viewport_height = app.page.height or 768
+        self._rows = []
+        self._views = {}
+        self.top_spacer = ft.Container(height=0)
+        self.bottom_spacer = ft.Container(height=0)
+        self.control = ft.Column(
+            controls=[self.top_spacer, self.bottom_spacer],
+            spacing=0,
+            scroll=ft.ScrollMode.AUTO,
+            expand=True,
+            on_scroll=self._on_scroll,
+            on_scroll_interval=50
+        )
+    
+    def set_tables(self, numbers):
+        self.numbers = list(numbers)
+        self.layout()
+    
+    def add(self, number: int):
+        self.numbers.append(number)
+        self.layout()
+    
+    def remove(self, number: int):
+        # Стол могли уже убрать дельтой из потока состояния
+        if number in self.numbers:
+            self.numbers.remove(number)
+            self.layout()
+    
+    def view_for(self, number: int) -> Optional[BilliardTable]:
+        return self._views.get(number)
+    
+    def on_screen_views(self):
+        """Виджеты столов в пределах окна прокрутки, без рядов запаса."""
+        first = int(self.scroll_offset // self.ROW_PITCH) * self.columns
+        last = math.ceil((self.scroll_offset + self.viewport_height) / self.ROW_PITCH) * self.columns
+        for number in self.numbers[first:last]:
+            view = self._views.get(number)
+            if view is not None:
+                yield view
+    
+    def tick_timers(self, now: datetime.datetime):
+        # Стоимость тика - O(столов на экране), в патч попадают только сменившиеся подписи
+        tables = self.app.tables
+        for view in self.on_screen_views():
+            table = tables.get(view.number)
+            if table is not None and table is not view.model:
+                # Стол изменился, а виджет ещё показывает старый снимок
+                view.bind(table)
+                self.app.batcher.mark_dirty(view)
+            elif view.model.status == TableStatus.OCCUPIED and view.model.start_time is not None:
+                changed = view.render_timer(now)
+                if changed:
+                    self.app.batcher.mark_dirty(*changed)
+    
+    def refresh(self, number: int):
+        view = self._views.get(number)
+        table = self.app.tables.get(number)
+        if view is not None and table is not None:
+            view.bind(table)
+            self.app.batcher.mark_dirty(view)
+    
+    def resize(self, width: float, height: Optional[float] = None):
+        columns = max(1, int((width + self.SPACING) // self.ROW_PITCH))
+        if height:
+            self.viewport_height = height
+        if columns != self.columns:
+            self.columns = columns
+            # Пул рядов строится заново под новое число колонок
+            self._rows = []
+            self._views = {}
+            self.control.controls = [self.top_spacer, self.bottom_spacer]
+            self.app.batcher.mark_dirty(self.control)
+        self.layout()
+    
+    @ui_handler
+    def _on_scroll(self, e: ft.OnScrollEvent):
+        self.scroll_offset = e.pixels or 0.0
+        if e.viewport_dimension:
+            self.viewport_height = e.viewport_dimension
+        first_row = max(0, int(self.scroll_offset // self.ROW_PITCH) - self.OVERSCAN_ROWS)
+        if first_row != self.first_row or len(self._rows) < self._visible_rows():
+            self.layout()
+    
+    def _visible_rows(self) -> int:
+        return math.ceil(self.viewport_height / self.ROW_PITCH) + 2 * self.OVERSCAN_ROWS
+    
+    def _new_row(self):
+        views = [BilliardTable(self.app) for _ in range(self.columns)]
+        return ft.Container(
+            height=self.ROW_PITCH,
+            alignment=ft.alignment.top_left,
+            content=ft.Row(views, spacing=self.SPACING)
+        )
+    
+    def layout(self):
+        tables = self.app.tables
+        total_rows = math.ceil(len(self.numbers) / self.columns)
+        visible_rows = min(self._visible_rows(), total_rows)
+        first_row = max(0, int(self.scroll_offset // self.ROW_PITCH) - self.OVERSCAN_ROWS)
+        self.first_row = max(0, min(first_row, total_rows - visible_rows))
+        
+        if len(self._rows) < visible_rows:
+            while len(self._rows) < visible_rows:
+                self._rows.append(self._new_row())
+            self.control.controls = [self.top_spacer, *self._rows, self.bottom_spacer]
+            self.app.batcher.mark_dirty(self.control)
+        
+        self._views = {}
+        for r, row in enumerate(self._rows):
+            row_visible = r < visible_rows
+            if row.visible != row_visible:
+                row.visible = row_visible
+                self.app.batcher.mark_dirty(row)
+            for c, view in enumerate(row.content.controls):
+                index = (self.first_row + r) * self.columns + c
+                model = tables.get(self.numbers[index]) if row_visible and index < len(self.numbers) else None
+                if model is not None:
+                    self._views[model.number] = view
+                # Перерисовываем только виджеты, у которых сменился стол или его снимок
+                if view.model is not model:
+                    view.bind(model)
+                    self.app.batcher.mark_dirty(view)
+        
+        top = self.first_row * self.ROW_PITCH
+        bottom = max(0, total_rows - self.first_row - visible_rows) * self.ROW_PITCH
+        if self.top_spacer.height != top or self.bottom_spacer.height != bottom:
+            self.top_spacer.height = top
+            self.bottom_spacer.height = bottom
+            self.app.batcher.mark_dirty(self.top_spacer, self.bottom_spacer)
+
+class OrderListView:
+    """Список позиций заказа в панели информации.
+
+    Пока показывается тот же заказ, перерисовываются только добавленные
+    строки и строки с изменившимся количеством; полная пересборка списка
+    происходит лишь при смене стола или очистке заказа.
+    """
+
+    def __init__(self, app, list_view: ft.ListView):
+        self.app = app
+        self.list_view = list_view
+        self._key = None
+        self._revision = None
+        self._rendered = []
+    
+    @staticmethod
+    def _line_text(line) -> ft.Text:
+        return ft.Text(f"• {line}", size=14, color="white")
+    
+    def show(self, table: Optional[TableState]):
+        order = table.order if table else None
+        key = (table.number, order.generation) if table else None
+        if key != self._key:
+            self._key = key
+            self._revision = order.revision if order else None
+            lines = order.lines if order else []
+            self.list_view.controls = [self._line_text(line) for line in lines]
+            self._rendered = [line.revision for line in lines]
+            self.app.batcher.mark_dirty(self.list_view)
+            return
+        
+        if order is None or order.revision == self._revision:
+            return
+        self._revision = order.revision
+        for i, line in enumerate(order.lines):
+            if i >= len(self._rendered):
+                self.list_view.controls.append(self._line_text(line))
+                self._rendered.append(line.revision)
+                self.app.batcher.mark_dirty(self.list_view)
+            elif self._rendered[i] != line.revision:
+                text = self.list_view.controls[i]
+                text.value = f"• {line}"
+                self._rendered[i] = line.revision
+                self.app.batcher.mark_dirty(text)
+
+class ReportsView:
+    """Экран "Отчёты": загрузка столов по часам, выручка по столам и продажи бара.
+
+    Отчёт считает ReportService в своём потоке; экран только раскладывает
+    готовые массивы по контролам. Пока идёт расчёт, виден прежний отчёт,
+    а повторный запрос того же диапазона без новых оплат ничего не меняет.
+    """
+
+    RANGES = (("Сегодня", 0), ("7 дней", 6), ("30 дней", 29), ("Год", 364))
+    CELL = 22
+
+    def __init__(self, app):
+        self.app = app
+        self.range_name = "7 дней"
+        self._pending = None
+        self._shown = None
+        self.range_buttons = ft.Row(
+            controls=[
+                ft.ElevatedButton(
+                    name,
+                    on_click=lambda e, name=name: self.select_range(name),
+                    height=36,
+                    style=Palette.filter_style(name == self.range_name)
+                )
+                for name, _ in self.RANGES
+            ],
+            spacing=12
+        )
+        self.status = ft.Text("", size=14, color="#BDBDBD")
+        self.summary = ft.Text("", size=16, color="white")
+        self.heatmap = ft.Column(spacing=2)
+        self.tables_table = self._data_table(
+            [("Стол", False), ("Сессий", True), ("Ср. длительность", True), ("Время", True), ("Бар", True), ("Итого", True)]
+        )
+        self.products_table = self._data_table([("Товар", False), ("Шт.", True), ("Выручка", True), ("Доля", True)])
+        self.control = ft.Column(
+            controls=[
+                ft.Row(
+                    controls=[
+                        ft.Text("Отчёты", size=20, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                        ft.Container(expand=True),
+                        self.range_buttons,
+                    ]
+                ),
+                ft.Row([self.summary, ft.Container(expand=True), self.status]),
+                ft.Text("Загрузка столов по часам", size=16, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                self.heatmap,
+                ft.Row(
+                    controls=[
+                        ft.Column([ft.Text("Выручка по столам", size=16, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                                   self.tables_table]),
+                        ft.Column([ft.Text("Продажи бара", size=16, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                                   self.products_table]),
+                    ],
+                    spacing=40,
+                    vertical_alignment=ft.CrossAxisAlignment.START,
+                    wrap=True
+                ),
+            ],
+            scroll=ft.ScrollMode.AUTO,
+            expand=True,
+            spacing=12
+        )
+    
+    @staticmethod
+    def _data_table(headers) -> ft.DataTable:
+        return ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(title, color="#BDBDBD"), numeric=numeric) for title, numeric in headers],
+            rows=[],
+            column_spacing=24
+        )
+    
+    def date_range(self) -> tuple:
+        last = datetime.date.today()
+        return last - datetime.timedelta(days=dict(self.RANGES)[self.range_name]), last
+    
+    @ui_handler
+    def select_range(self, name: str):
+        previous = self.range_name
+        self.range_name = name
+        for btn in self.range_buttons.controls:
+            if btn.text in (name, previous):
+                btn.style = Palette.filter_style(btn.text == name)
+                self.app.batcher.mark_dirty(btn)
+        self.refresh()
+    
+    def refresh(self):
+        future = self.app.hub.reports.request(*self.date_range())
+        self._pending = future
+        if future.done():
+            self._show(future)
+            return
+        self._set_status("Считаем…")
+        future.add_done_callback(self._on_ready)
+    
+    def _on_ready(self, future):
+        # Вызывается в потоке отчётов: раскладка под UI-блокировкой, как у тиков и дельт
+        with self.app.batcher.ui_lock:
+            if future is self._pending:
+                self._show(future)
+    
+    def _set_status(self, value: str):
+        if self.status.value != value:
+            self.status.value = value
+            self.app.batcher.mark_dirty(self.status)
+    
+    def _show(self, future):
+        try:
+            report = future.result()
+        except Exception as e:
+            logging.error(f"Error building report: {e}")
+            self._set_status("Не удалось построить отчёт")
+            return
+        self._set_status("")
+        if report is self._shown:
+            return
+        self._shown = report
         
-        self.update()
+        self.summary.value = (
+            f"Сессий: {report.sessions} · средняя длительность {format_duration(report.avg_seconds)} · "
+            f"выручка {format_money(report.total)} (время {format_money(report.time_cost)}, "
+            f"бар {format_money(report.products_cost)})"
+        )
+        self.heatmap.controls = self._heatmap_rows(report)
+        self.tables_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(f"{row['table']}", color="white")),
+                ft.DataCell(ft.Text(f"{row['sessions']}", color="white")),
+                ft.DataCell(ft.Text(format_duration(row["avg_seconds"]), color="white")),
+                ft.DataCell(ft.Text(format_money(row["time_cost"]), color="white")),
+                ft.DataCell(ft.Text(format_money(row["products_cost"]), color="white")),
+                ft.DataCell(ft.Text(format_money(row["total"]), color="white")),
+            ])
+            for row in report.table_rows
+        ]
+        self.products_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(row["name"], color="white")),
+                ft.DataCell(ft.Text(f"{row['quantity']}", color="white")),
+                ft.DataCell(ft.Text(format_money(row["revenue"]), color="white")),
+                ft.DataCell(ft.Text(f"{row['share'] * 100:.1f}%", color="white")),
+            ])
+            for row in report.products
+        ]
+        self.app.batcher.mark_dirty(self.summary, self.heatmap, self.tables_table, self.products_table)
+    
+    def _heatmap_rows(self, report) -> list:
+        if not report.sessions:
+            return [ft.Text("Нет оплаченных сессий за период", color="#BDBDBD")]
+        header = ft.Row(
+            controls=[ft.Container(width=60)] + [
+                ft.Container(
+                    width=self.CELL,
+                    content=ft.Text(f"{hour}" if hour % 3 == 0 else "", size=11, color="#BDBDBD")
+                )
+                for hour in range(24)
+            ],
+            spacing=2
+        )
+        levels = np.clip((report.heatmap * Palette.HEAT_LEVELS).round(), 0, Palette.HEAT_LEVELS).astype(int)
+        rows = [header]
+        for table, shares, table_levels in zip(report.tables, report.heatmap, levels):
+            rows.append(ft.Row(
+                controls=[ft.Text(f"Стол {table}", width=60, size=12, color="white")] + [
+                    ft.Container(
+                        width=self.CELL,
+                        height=16,
+                        border_radius=3,
+                        bgcolor=Palette.heat(int(level)),
+                        tooltip=f"{hour:02d}:00 - {share * 100:.0f}%"
+                    )
+                    for hour, (share, level) in enumerate(zip(shares, table_levels))
+                ],
+                spacing=2
+            ))
+        return rows
 
 class ProductItem(ft.Container):
-    def __init__(self, app, name: str, price: float, stock: int, category: str, **kwargs):
+    def __init__(self, app, item: StockItem, **kwargs):
         super().__init__(**kwargs)
         self.app = app
-        self.name = name
-        self.price = price
-        self.stock = stock
-        self.category = category
+        # Карточка строится один раз; цена и остаток читаются из позиции склада
+        self.item = item
+        self.name = item.name
+        self.price = item.price
+        self.category = item.category
         self.width = 200
         self.height = 140
-        self.bgcolor=ft.colors.with_opacity(0.8, "#424242")
+        self.bgcolor=Palette.CARD_BGCOLOR
         self.border_radius=14
         self.padding=14
-        self.border=ft.border.all(1, ft.colors.with_opacity(0.3, "#616161"))
-        self.animate=ft.Animation(300, ft.AnimationCurve.EASE_IN_OUT)
-        self.on_hover=self.hover_animation
-        self.shadow = ft.BoxShadow(
-            spread_radius=0,
-            blur_radius=10,
-            color=ft.colors.with_opacity(0.2, "#000000"),
-        )
+        self.border=Palette.card_border()
+        self.animate=Palette.EASE_300
+        self.hovered = False
+        if app.hover_mode != "client":
+            # В клиентском режиме отклик на наведение даёт только стиль кнопки "Добавить"
+            self.on_hover=self.hover_animation
+        self.shadow = Palette.CARD_SHADOW
         
         self.content=ft.Column(
             controls=[
@@ -216,16 +930,16 @@ class ProductItem(ft.Container):
                     height=60,
                     width=60,
                     border_radius=10,
-                    bgcolor=ft.colors.with_opacity(0.2, "#616161"),
+                    bgcolor=Palette.CARD_ICON_BGCOLOR,
                     content=ft.Icon(ft.icons.LOCAL_BAR, color="white", size=28),
                     alignment=ft.alignment.center,
-                    animate_scale=ft.Animation(200, ft.AnimationCurve.EASE_IN_OUT)
+                    animate_scale=Palette.EASE_200
                 ),
-                ft.Text(self.name, weight=ft.FontWeight.BOLD, size=16, color="white"),
+                ft.Text(self.name, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, size=16, color="white"),
                 ft.Row(
                     controls=[
-                        ft.Text(f"{self.price:.2f} ₽", color="#4CAF50", size=14),
-                        ft.Text(f"{self.stock} шт.", size=12, color="#BDBDBD")
+                        ft.Text(format_money(self.price), color="#4CAF50", size=14),
+                        ft.Text(f"{self.stock} шт.", size=12, color=self._stock_color())
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                     width=170
@@ -236,13 +950,7 @@ class ProductItem(ft.Container):
                     width=140,
                     height=36,
                     on_click=self.add_to_table,
-                    style=ft.ButtonStyle(
-                        padding=ft.Padding(0, 0, 0, 0),
-                        bgcolor={"": ft.colors.with_opacity(0.8, "#42A5F5"), "hovered": ft.colors.with_opacity(1, "#1E88E5")},
-                        shape=ft.RoundedRectangleBorder(radius=10),
-                        animation_duration=200,
-                        overlay_color=ft.colors.with_opacity(0.1, "#FFFFFF")
-                    )
+                    style=Palette.CARD_BUTTON_STYLE
                 )
             ],
             alignment=ft.MainAxisAlignment.CENTER,
@@ -250,39 +958,82 @@ class ProductItem(ft.Container):
             spacing=6
         )
     
+    @property
+    def stock(self) -> int:
+        return self.item.stock
+    
+    def _stock_color(self) -> str:
+        if self.item.stock <= 0:
+            return Palette.STOCK_EMPTY
+        return Palette.STOCK_LOW if self.item.low else Palette.STOCK_OK
+    
+    def refresh_stock(self):
+        label = self.content.controls[2].controls[1]
+        value, color = f"{self.stock} шт.", self._stock_color()
+        if label.value != value or label.color != color:
+            label.value = value
+            label.color = color
+            self.app.batcher.mark_dirty(label)
+    
+    @PROFILER.instrument("product_hover")
     def hover_animation(self, e):
-        self.scale = 1.02 if e.data == "true" else 1
-        self.border = ft.border.all(1, ft.colors.with_opacity(0.8, "#42A5F5") if e.data == "true" else ft.colors.with_opacity(0.3, "#616161"))
-        self.bgcolor = ft.colors.with_opacity(0.9, "#616161") if e.data == "true" else ft.colors.with_opacity(0.8, "#424242")
-        self.content.controls[0].scale = 1.1 if e.data == "true" else 1
-        self.update()
+        self.app.hover.hover(self, e.data == "true")
     
+    def apply_hover(self, hovered: bool):
+        self.scale = 1.02 if hovered else 1
+        self.border = Palette.card_border(hovered=hovered)
+        self.bgcolor = Palette.CARD_BGCOLOR_HOVER if hovered else Palette.CARD_BGCOLOR
+        self.content.controls[0].scale = 1.1 if hovered else 1
+        self.app.batcher.mark_dirty(self)
+    
+    @ui_handler
+    @PROFILER.instrument("add_to_table")
     def add_to_table(self, e):
         if not self.app.tables:
             self.app.show_snackbar("Нет доступных столов")
             return
-            
-        def on_table_selected(e):
-            if not dd.value:
-                self.app.show_snackbar("Выберите стол")
-                return
-                
-            table_number = int(dd.value)
-            table = next(t for t in self.app.tables if t.number == table_number)
-            if table.status != TableStatus.OCCUPIED:
-                self.app.show_snackbar(f"Стол {table_number} должен быть занят")
-                return
-                
-            table.products.append({"name": self.name, "price": self.price})
-            self.stock -= 1
-            self.content.controls[2].controls[1].value = f"{self.stock} шт."
-            self.update()
-            self.app.update_table_info(table)
-            self.app.show_snackbar(f"Добавлено {self.name} к столу {table_number}")
-            self.app.close_dialog()
-        
-        dd = ft.Dropdown(
-            options=[ft.dropdown.Option(t.number) for t in self.app.tables if t.status == TableStatus.OCCUPIED],
+        if self.stock <= 0:
+            self.app.show_snackbar(f"{self.name}: нет на складе")
+            return
+        self.app.pooled(OrderDialog).open(self)
+
+# Диалог строится один раз (build) и живёт в page.overlay; повторные открытия - только патч изменившихся подписей
+class PooledDialog(abc.ABC):
+    def __init__(self, app):
+        self.app = app
+        self._mounted = False
+        self.dialog = self.build()
+
+    @abc.abstractmethod
+    def build(self) -> ft.AlertDialog:
+        ...
+
+    @ui_handler
+    def show(self):
+        self.dialog.open = True
+        self.app.active_dialog = self
+        if self._mounted:
+            self.app.batcher.mark_dirty(self.dialog)
+            return
+        self._mounted = True
+        self.app.page.overlay.append(self.dialog)
+        self.app.batcher.mark_dirty(self.app.page)
+
+    @ui_handler
+    def close(self):
+        if self.dialog.open:
+            self.dialog.open = False
+            self.app.batcher.mark_dirty(self.dialog)
+        if self.app.active_dialog is self:
+            self.app.active_dialog = None
+
+# Добавление товара к столу; список занятых столов поддерживается по дельтам (track), а не собирается при открытии
+class OrderDialog(PooledDialog):
+    def build(self) -> ft.AlertDialog:
+        self.card = None
+        self.title = ft.Text("", color="white", size=18)
+        self.choices = ft.Dropdown(
+            options=[],
             width=220,
             height=48,
             hint_text="Выберите стол",
@@ -293,15 +1044,18 @@ class ProductItem(ft.Container):
             border_radius=10,
             text_size=14
         )
-        
-        self.app.page.dialog = ft.AlertDialog(
-            title=ft.Text(f"Добавить {self.name} к столу", color="white", size=18),
-            content=dd,
+        self._numbers = []
+        for number in self.app.tables.numbers_with_status(TableStatus.OCCUPIED):
+            self._numbers.append(number)
+            self.choices.options.append(ft.dropdown.Option(f"{number}"))
+        return ft.AlertDialog(
+            title=self.title,
+            content=self.choices,
             bgcolor=ft.colors.with_opacity(0.9, "#2E2E2E"),
             actions=[
                 ft.ElevatedButton(
                     "Добавить",
-                    on_click=on_table_selected,
+                    on_click=self.confirm,
                     style=ft.ButtonStyle(
                         bgcolor={"": "#42A5F5", "hovered": "#1E88E5"},
                         padding=ft.Padding(16, 8, 16, 8),
@@ -310,7 +1064,7 @@ class ProductItem(ft.Container):
                 ),
                 ft.OutlinedButton(
                     "Отмена",
-                    on_click=lambda e: self.app.close_dialog(),
+                    on_click=lambda e: self.close(),
                     style=ft.ButtonStyle(
                         side=ft.BorderSide(1, "#616161"),
                         shape=ft.RoundedRectangleBorder(radius=10)
@@ -320,12 +1074,298 @@ class ProductItem(ft.Container):
             actions_alignment=ft.MainAxisAlignment.END,
             shape=ft.RoundedRectangleBorder(radius=12)
         )
-        self.app.page.dialog.open = True
-        self.app.page.update()
+
+    def track(self, number: int, table: Optional[TableState]):
+        occupied = table is not None and table.status == TableStatus.OCCUPIED
+        i = bisect.bisect_left(self._numbers, number)
+        present = i < len(self._numbers) and self._numbers[i] == number
+        if occupied and not present:
+            self._numbers.insert(i, number)
+            self.choices.options.insert(i, ft.dropdown.Option(f"{number}"))
+        elif present and not occupied:
+            del self._numbers[i]
+            del self.choices.options[i]
+            if self.choices.value == f"{number}":
+                self.choices.value = None
+        else:
+            return
+        self.app.batcher.mark_dirty(self.choices)
+
+    def open(self, card):
+        self.card = card
+        self.title.value = f"Добавить {card.name} к столу (на складе {card.stock} шт.)"
+        self.choices.value = None
+        self.show()
+
+    @ui_handler
+    @PROFILER.instrument("add_to_table:confirm")
+    def confirm(self, e):
+        card = self.card
+        if not self.choices.value:
+            self.app.show_snackbar("Выберите стол")
+            return
+
+        table_number = int(self.choices.value)
+        try:
+            # Проверка статуса, добавление и списание выполняются одной командой
+            table = self.app.state.add_order_line(table_number, card.name, card.price)
+        except ValueError as error:
+            self.app.show_snackbar(str(error))
+            return
+
+        card.refresh_stock()
+        self.app.update_table_info(table)
+        if card.item.low:
+            self.app.show_snackbar(f"Добавлено {card.name} к столу {table_number}. Заканчивается: осталось {card.stock} шт.")
+        else:
+            self.app.show_snackbar(f"Добавлено {card.name} к столу {table_number}")
+        self.close()
+
+# Чек при остановке аренды: оплачивается ровно показанный счёт на момент открытия чека
+class ReceiptDialog(PooledDialog):
+    def build(self) -> ft.AlertDialog:
+        self.number = None
+        self.closed_at = None
+        self.bill_key = None
+        self.table_text = ft.Text("", size=18, color="white")
+        self.time_text = ft.Text("", size=16, color="white")
+        self.tariff_text = ft.Text("", size=16, color="white")
+        self.time_cost_text = ft.Text("", size=16, color="white")
+        self.lines = ft.Column(spacing=10)
+        self.total_text = ft.Text("", size=20, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="#4CAF50")
+        return ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Оплата аренды"),
+            content=ft.Container(
+                content=ft.Column(
+                    controls=[
+                        ft.Text("Чек", size=24, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                        ft.Divider(color=ft.colors.with_opacity(0.1, "#FFFFFF")),
+                        self.table_text,
+                        self.time_text,
+                        self.tariff_text,
+                        self.time_cost_text,
+                        ft.Text("Товары:", size=16, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                        self.lines,
+                        ft.Divider(color=ft.colors.with_opacity(0.1, "#FFFFFF")),
+                        self.total_text,
+                    ],
+                    spacing=10
+                ),
+                padding=10
+            ),
+            actions=[
+                ft.TextButton("Закрыть", on_click=self.confirm),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+
+    def open(self, table: TableState, now: datetime.datetime):
+        self.number = table.number
+        self.closed_at = now
+        self.bill_key = table.bill_key
+        time_cost = table.time_cost(now)
+        self.table_text.value = f"Стол: {table.number}"
+        self.time_text.value = f"Время: {format_duration((now - table.start_time).total_seconds())}"
+        self.tariff_text.value = f"Тариф: {table.tariff.describe(now)}"
+        self.time_cost_text.value = f"Стоимость времени: {format_money(time_cost)}"
+        self.lines.controls = [ft.Text(f"- {line}", color="white") for line in table.order]
+        self.total_text.value = f"Итого: {format_money(time_cost + table.order_total)}"
+        self.show()
+
+    @ui_handler
+    def confirm(self, e):
+        self.close()
+        self.app.settle_rental(self.number, self.closed_at, self.bill_key)
+
+# Сводный чек при закрытии нескольких аренд: строка на стол и общий итог
+class BulkReceiptDialog(PooledDialog):
+    def build(self) -> ft.AlertDialog:
+        self.numbers = []
+        self.bill_keys = {}
+        self.closed_at = None
+        self.title = ft.Text("")
+        self.lines = ft.ListView(height=320, width=460, spacing=6)
+        self.total_text = ft.Text("", size=20, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="#4CAF50")
+        return ft.AlertDialog(
+            modal=True,
+            title=self.title,
+            content=ft.Column(
+                controls=[
+                    self.lines,
+                    ft.Divider(color=ft.colors.with_opacity(0.1, "#FFFFFF")),
+                    self.total_text,
+                ],
+                tight=True,
+                spacing=10
+            ),
+            actions=[
+                ft.TextButton("Оплатить все", on_click=self.confirm),
+                ft.TextButton("Отмена", on_click=lambda e: self.close()),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+
+    def open(self, tables: list, now: datetime.datetime):
+        self.numbers = [table.number for table in tables]
+        self.bill_keys = {table.number: table.bill_key for table in tables}
+        self.closed_at = now
+        total = 0
+        self.lines.controls = []
+        for table in tables:
+            time_cost = table.time_cost(now)
+            total += time_cost + table.order_total
+            self.lines.controls.append(ft.Text(
+                f"Стол {table.number}: {format_duration((now - table.start_time).total_seconds())}, "
+                f"время {format_money(time_cost)}, бар {format_money(table.order_total)} "
+                f"({len(table.order)} поз.) - {format_money(time_cost + table.order_total)}",
+                color="white"
+            ))
+        self.title.value = f"Оплата аренд: столов {len(tables)}"
+        self.total_text.value = f"Итого: {format_money(total)}"
+        self.show()
+
+    @ui_handler
+    def confirm(self, e):
+        self.close()
+        self.app.settle_rentals(self.numbers, self.closed_at, self.bill_keys)
+
+# Вопрос "Да/Нет"; on_confirm сам закрывает диалог, если действие удалось
+class ConfirmDialog(PooledDialog):
+    def build(self) -> ft.AlertDialog:
+        self.on_confirm = None
+        self.title = ft.Text("")
+        self.message = ft.Text("")
+        return ft.AlertDialog(
+            modal=True,
+            title=self.title,
+            content=self.message,
+            actions=[
+                ft.TextButton("Да", on_click=self.confirm),
+                ft.TextButton("Нет", on_click=lambda e: self.close()),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+
+    def open(self, title: str, message: str, on_confirm):
+        self.title.value = title
+        self.message.value = message
+        self.on_confirm = on_confirm
+        self.show()
+
+    @ui_handler
+    def confirm(self, e):
+        self.on_confirm()
+
+class WindowFields:
+    """Поля окна брони: дата и время начала и конца."""
+
+    def __init__(self):
+        self.day = ft.TextField(label="Дата", width=140)
+        self.start = ft.TextField(label="С", width=90)
+        self.end = ft.TextField(label="До", width=90)
+        self.row = ft.Row([self.day, self.start, self.end])
+
+    def reset(self):
+        # По умолчанию - ближайший полный час на два часа
+        start = (datetime.datetime.now() + datetime.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        end = start + datetime.timedelta(hours=2)
+        self.day.value = f"{start:%d.%m.%Y}"
+        self.start.value = f"{start:%H:%M}"
+        self.end.value = f"{end:%H:%M}"
+
+    def read(self, app) -> Optional[tuple]:
+        try:
+            return parse_window(self.day.value, self.start.value, self.end.value)
+        except ValueError:
+            app.show_snackbar("Дата - ДД.ММ.ГГГГ, время - ЧЧ:ММ")
+            return None
+
+class ReservationDialog(PooledDialog):
+    def build(self) -> ft.AlertDialog:
+        self.number = None
+        self.title = ft.Text("")
+        self.customer = ft.TextField(label="Клиент", width=330)
+        self.phone = ft.TextField(label="Телефон", width=330)
+        self.window = WindowFields()
+        return ft.AlertDialog(
+            modal=True,
+            title=self.title,
+            content=ft.Column([self.customer, self.phone, self.window.row], tight=True, spacing=12),
+            actions=[
+                ft.TextButton("Забронировать", on_click=self.confirm),
+                ft.TextButton("Отмена", on_click=lambda e: self.close()),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+
+    def open(self, number: int):
+        self.number = number
+        self.title.value = f"Бронь стола {number}"
+        self.customer.value = ""
+        self.phone.value = ""
+        self.window.reset()
+        self.show()
+
+    @ui_handler
+    def confirm(self, e):
+        span = self.window.read(self.app)
+        if span is None:
+            return
+        app, number = self.app, self.number
+        try:
+            reservation = app.state.reserve(number, *span, self.customer.value.strip(), self.phone.value.strip())
+        except ValueError as error:
+            app.show_snackbar(str(error))
+            return
+        app.board.refresh(number)
+        if number == app.selected_number:
+            app.update_table_info(app.tables.get(number))
+        app.show_snackbar(f"Стол {number} забронирован: {reservation.describe()}")
+        self.close()
+
+class FreeTablesDialog(PooledDialog):
+    def build(self) -> ft.AlertDialog:
+        self.window = WindowFields()
+        self.result = ft.Text("", color="white", width=330)
+        return ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Свободные столы"),
+            content=ft.Column([self.window.row, self.result], tight=True, spacing=12),
+            actions=[
+                ft.TextButton("Найти", on_click=self.search),
+                ft.TextButton("Закрыть", on_click=lambda e: self.close()),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+
+    def open(self):
+        self.window.reset()
+        self.result.value = ""
+        self.show()
+
+    @ui_handler
+    def search(self, e):
+        span = self.window.read(self.app)
+        if span is None:
+            return
+        free = self.app.state.free_tables(*span)
+        self.result.value = f"Свободны: {', '.join(map(str, free))}" if free else "Свободных столов нет"
+        self.app.batcher.mark_dirty(self.result)
 
 class BilliardApp:
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, storage: Optional[Storage] = None,
+                 products: Optional[list] = None, table_count: int = 8,
+                 hover_mode: Optional[str] = None, hub: Optional[ClubHub] = None):
+        self.startup = StartupTimer()
         self.page = page
+        # Все сессии процесса работают с одним клубом; отдельное хранилище - отдельный клуб
+        self.hub = hub or (ClubHub(storage) if storage is not None else ClubHub.shared())
+        self.storage = self.hub.storage
+        self.startup.mark("hub")
+        # "client" - hover только средствами клиента (по умолчанию в веб-режиме),
+        # "throttled" - серверные эффекты через HoverCoalescer
+        self.hover_mode = hover_mode or ("client" if page.web else "throttled")
         self.page.title = "Billiard Club Pro"
         self.page.window_width = 1366
         self.page.window_height = 768
@@ -334,30 +1374,52 @@ class BilliardApp:
         self.page.padding = 0
         self.page.theme_mode = ft.ThemeMode.DARK
         self.page.bgcolor = "#121212"
-        self.page.fonts = {
-            "Roboto": "https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap"
-        }
-        self.page.theme = ft.Theme(font_family="Roboto")
+        # Шрифты лежат в ассетах приложения и не требуют интернета
+        self.page.fonts = FONTS
+        self.page.theme = ft.Theme(font_family=FONT_FAMILY)
         
-        self.selected_table = None
+        self.selected_number = None
+        # Номера выбранных столов (упорядоченное множество): при клике перерисовываются только старый и новый выбор
+        self.selected_tables = {}
+        self.multi_select = False
         self.current_view = "tables"
-        self.tables = []
-        self.products = [
-            {"name": "Пиво", "price": 150.00, "stock": 24, "category": "Алкоголь"},
-            {"name": "Кола", "price": 80.00, "stock": 36, "category": "Напитки"},
-            {"name": "Вода", "price": 50.00, "stock": 48, "category": "Напитки"},
-            {"name": "Чипсы", "price": 120.00, "stock": 20, "category": "Закуски"},
-            {"name": "Кофе", "price": 90.00, "stock": 30, "category": "Напитки"},
-            {"name": "Чай", "price": 60.00, "stock": 40, "category": "Напитки"},
-            {"name": "Бургер", "price": 180.00, "stock": 15, "category": "Закуски"},
-            {"name": "Вино", "price": 250.00, "stock": 12, "category": "Алкоголь"},
-        ]
+        # Столы и склад меняются только командами ClubState, здесь читаются снимки
+        self.state = self.hub.state
+        self.products = []
         self.current_category = "Все"
+        self.product_cards = {}
+        self.category_index = {}
         
+        self.batcher = UpdateBatcher(page)
+        self.hover = HoverCoalescer(page, self.batcher)
+        self.scheduler = TickScheduler(self.hub, self.batcher)
+        self._deltas = []
+        self._deltas_scheduled = False
+        self._deltas_lock = threading.Lock()
+        self._info_table = None
+        # Диалоги строятся при первом открытии и дальше только перепривязываются
+        self._dialogs = {}
+        self.active_dialog = None
+        self._snack_index = 0
+        # Сначала каркас страницы с пустой доской - это первый кадр; столы и каталог догружаются после него
         self.setup_ui()
-        self.initialize_tables()
-        self.update_clock()
-        self.start_cost_updater()
+        self.startup.mark("first_frame")
+        self.initialize_tables(table_count)
+        self.startup.mark("tables")
+        self.products = self.hub.load_catalog(products if products is not None else [dict(p) for p in DEFAULT_PRODUCTS])
+        self.startup.mark("catalog")
+        self.scheduler.every(1, self.update_clock)
+        self.scheduler.every(1, self.update_timers)
+        self.scheduler.every(2, self.refresh_diagnostics)
+        self.scheduler.every(30, self.refresh_reports)
+        
+        self.page.on_connect = lambda e: self.hub.connected(self)
+        self.page.on_disconnect = lambda e: self.hub.disconnected(self)
+        self.page.on_close = lambda e: self.hub.detach(self)
+        self.hub.attach(self)
+        self.scheduler.start()
+        self.startup.mark("ready")
+        self.startup.dump()
     
     def setup_ui(self):
         # Верхняя панель с эффектом стекла
@@ -371,18 +1433,15 @@ class BilliardApp:
                     ft.Row(
                         controls=[
                             ft.Icon(ft.icons.SPORTS_BAR, color="#42A5F5", size=30),
-                            ft.Text("Billiard Club Pro", size=24, weight=ft.FontWeight.BOLD, color="white"),
+                            ft.Text("Billiard Club Pro", size=24, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
                         ],
                         spacing=12,
                         alignment=ft.MainAxisAlignment.START
                     ),
                     ft.Container(expand=True),
-                    ft.Container(
+                    ft.TextButton(
                         width=200,
                         height=44,
-                        bgcolor=ft.colors.with_opacity(0.4, "#424242"),
-                        border_radius=22,
-                        padding=ft.padding.symmetric(horizontal=16),
                         content=ft.Row(
                             controls=[
                                 ft.Icon(ft.icons.ACCOUNT_CIRCLE_OUTLINED, size=22, color="white"),
@@ -391,9 +1450,7 @@ class BilliardApp:
                             spacing=12,
                             alignment=ft.MainAxisAlignment.CENTER
                         ),
-                        border=ft.border.all(1, ft.colors.with_opacity(0.1, "#FFFFFF")),
-                        animate=ft.Animation(300, ft.AnimationCurve.EASE_IN_OUT),
-                        on_hover=lambda e: self._navbar_hover(e)
+                        style=Palette.NAVBAR_USER_STYLE,
                     ),
                     self.clock_display()
                 ],
@@ -408,6 +1465,18 @@ class BilliardApp:
             )
         )
         
+        # Диагностика скрыта от операторов и открывается по Ctrl+Shift+D
+        self.diagnostics_tile = ft.ListTile(
+            leading=ft.Icon(ft.icons.MONITOR_HEART_OUTLINED, color="white"),
+            title=ft.Text("Диагностика", color="white"),
+            on_click=lambda e: self.switch_view("diagnostics"),
+            hover_color=ft.colors.with_opacity(0.1, "#42A5F5"),
+            height=48,
+            shape=ft.RoundedRectangleBorder(radius=8),
+            visible=False
+        )
+        self.page.on_keyboard_event = self._on_keyboard
+        
         # Боковое меню
         self.sidebar = ft.Container(
             width=240,
@@ -434,6 +1503,16 @@ class BilliardApp:
                         height=48,
                         shape=ft.RoundedRectangleBorder(radius=8)
                     ),
+                    ft.ListTile(
+                        leading=ft.Icon(ft.icons.INSIGHTS_OUTLINED, color="white"),
+                        title=ft.Text("Отчёты", color="white"),
+                        selected=self.current_view == "reports",
+                        on_click=lambda e: self.switch_view("reports"),
+                        hover_color=ft.colors.with_opacity(0.1, "#42A5F5"),
+                        height=48,
+                        shape=ft.RoundedRectangleBorder(radius=8)
+                    ),
+                    self.diagnostics_tile,
                     ft.Container(expand=True),
                 ],
                 spacing=4
@@ -451,8 +1530,16 @@ class BilliardApp:
                 controls=[
                     ft.Row(
                         controls=[
-                            ft.Text("Информация о столе", size=20, weight=ft.FontWeight.BOLD, color="white"),
+                            ft.Text("Информация о столе", size=20, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
                             ft.Container(expand=True),
+                            ft.IconButton(
+                                icon=ft.icons.CHECKLIST,
+                                icon_color="white",
+                                selected_icon_color="#42A5F5",
+                                selected=self.multi_select,
+                                tooltip="Множественный выбор",
+                                on_click=self.toggle_multi_select
+                            ),
                             ft.PopupMenuButton(
                                 icon=ft.icons.MORE_VERT,
                                 icon_color="white",
@@ -468,6 +1555,7 @@ class BilliardApp:
                             self._create_info_row("Статус:", "-"),
                             self._create_info_row("Время:", "-"),
                             self._create_info_row("Стоимость:", "-"),
+                            self._create_info_row("Бронь:", "-"),
                             ft.Container(
                                 content=ft.ListView(height=120, spacing=6),
                                 padding=ft.padding.only(top=10)
@@ -484,97 +1572,22 @@ class BilliardApp:
                 color=ft.colors.with_opacity(0.2, "#000000"),
             )
         )
+        self.order_view = OrderListView(self, self.table_info_panel.content.controls[2].controls[5].content)
         
         # Доска с столами
+        self.board = TableBoard(self)
+        self.board.resize(self._board_width())
         self.board_container = ft.Container(
             expand=True,
             padding=20,
-            content=ft.GridView(
-                runs_count=4,
-                max_extent=200,
-                child_aspect_ratio=0.9,
-                spacing=20,
-                run_spacing=20,
-            )
+            content=self.board.control
         )
+        self.page.on_resized = self._on_page_resized
         
-        # Фильтры для бара
-        self.category_filter = ft.Row(
-            controls=[
-                ft.ElevatedButton(
-                    "Все",
-                    on_click=lambda e: self.filter_products("Все"),
-                    bgcolor={"": "#42A5F5", "hovered": "#1E88E5"},
-                    color="white",
-                    height=36,
-                    style=ft.ButtonStyle(
-                        shape=ft.RoundedRectangleBorder(radius=10),
-                        padding=ft.Padding(20, 0, 20, 0),
-                        animation_duration=200
-                    )
-                ),
-                ft.ElevatedButton(
-                    "Напитки",
-                    on_click=lambda e: self.filter_products("Напитки"),
-                    bgcolor={"": ft.colors.with_opacity(0.3, "#424242"), "hovered": ft.colors.with_opacity(0.5, "#424242")},
-                    color="white",
-                    height=36,
-                    style=ft.ButtonStyle(
-                        shape=ft.RoundedRectangleBorder(radius=10),
-                        padding=ft.Padding(20, 0, 20, 0),
-                        animation_duration=200
-                    )
-                ),
-                ft.ElevatedButton(
-                    "Закуски",
-                    on_click=lambda e: self.filter_products("Закуски"),
-                    bgcolor={"": ft.colors.with_opacity(0.3, "#424242"), "hovered": ft.colors.with_opacity(0.5, "#424242")},
-                    color="white",
-                    height=36,
-                    style=ft.ButtonStyle(
-                        shape=ft.RoundedRectangleBorder(radius=10),
-                        padding=ft.Padding(20, 0, 20, 0),
-                        animation_duration=200
-                    )
-                ),
-                ft.ElevatedButton(
-                    "Алкоголь",
-                    on_click=lambda e: self.filter_products("Алкоголь"),
-                    bgcolor={"": ft.colors.with_opacity(0.3, "#424242"), "hovered": ft.colors.with_opacity(0.5, "#424242")},
-                    color="white",
-                    height=36,
-                    style=ft.ButtonStyle(
-                        shape=ft.RoundedRectangleBorder(radius=10),
-                        padding=ft.Padding(20, 0, 20, 0),
-                        animation_duration=200
-                    )
-                ),
-            ],
-            spacing=12,
-            scroll=ft.ScrollMode.AUTO,
-            wrap=True
-        )
-        
-        # Меню бара
-        self.service_view = ft.Column(
-            controls=[
-                ft.Container(
-                    padding=ft.padding.symmetric(vertical=10, horizontal=20),
-                    content=self.category_filter
-                ),
-                ft.GridView(
-                    runs_count=4,
-                    max_extent=220,
-                    child_aspect_ratio=0.85,
-                    spacing=15,
-                    run_spacing=15,
-                    padding=20,
-                    expand=True
-                )
-            ],
-            expand=True,
-            spacing=0
-        )
+        # Бар и отчёты строятся при первом открытии (_view_control), а не до первого кадра
+        self.service_view = None
+        self.reports_view = None
+        self.diagnostics_view = self._create_diagnostics_view()
         
         # Основная область контента
         self.main_content = ft.Container(
@@ -584,7 +1597,7 @@ class BilliardApp:
                 controls=[
                     self.table_info_panel if self.current_view == "tables" else ft.Container(),
                     ft.Container(
-                        content=self.board_container if self.current_view == "tables" else self.service_view,
+                        content=self._view_control(self.current_view),
                         expand=True
                     )
                 ],
@@ -603,10 +1616,92 @@ class BilliardApp:
                 spacing=0
             )
         )
+        # Два снекбара в overlay уходят клиенту вместе с первым кадром; дальше меняются только текст и open
+        self.snack_bars = [ft.SnackBar(content=ft.Text("")) for _ in range(2)]
+        self.page.overlay.extend(self.snack_bars)
     
-    def _navbar_hover(self, e):
-        e.control.bgcolor = ft.colors.with_opacity(0.6, "#424242") if e.data == "true" else ft.colors.with_opacity(0.4, "#424242")
-        e.control.update()
+    def _create_diagnostics_view(self):
+        headers = [("Обработчик", False), ("Вызовы", True), ("Среднее, мс", True), ("p50, мс", True),
+                   ("p95, мс", True), ("Макс, мс", True), ("Всего, мс", True), ("Контролов", True)]
+        self.diagnostics_table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(title, color="#BDBDBD"), numeric=numeric) for title, numeric in headers],
+            rows=[],
+            column_spacing=24
+        )
+        self.diagnostics_summary = ft.Text("", size=14, color="#BDBDBD")
+        return ft.Column(
+            controls=[
+                ft.Row(
+                    controls=[
+                        ft.Text("Диагностика", size=20, weight=ft.FontWeight.BOLD, font_family=FONT_FAMILY_BOLD, color="white"),
+                        ft.Container(expand=True),
+                        ft.TextButton("Обновить", icon=ft.icons.REFRESH, on_click=lambda e: self.refresh_diagnostics()),
+                        ft.TextButton("Записать в лог", icon=ft.icons.SAVE_ALT, on_click=self._dump_diagnostics),
+                        ft.TextButton("Сбросить", icon=ft.icons.RESTART_ALT, on_click=self._reset_diagnostics),
+                    ]
+                ),
+                self.diagnostics_summary,
+                ft.Column([self.diagnostics_table], scroll=ft.ScrollMode.AUTO, expand=True)
+            ],
+            expand=True,
+            spacing=12
+        )
+    
+    @ui_handler
+    def refresh_diagnostics(self, now: Optional[datetime.datetime] = None):
+        if now is not None and self.current_view != "diagnostics":
+            return
+        self.diagnostics_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(row["name"], color="white")),
+                ft.DataCell(ft.Text(f"{row['count']}", color="white")),
+                ft.DataCell(ft.Text(f"{row['mean_ms']:.2f}", color="white")),
+                ft.DataCell(ft.Text(f"{row['p50_ms']:.2f}", color="white")),
+                ft.DataCell(ft.Text(f"{row['p95_ms']:.2f}", color="white")),
+                ft.DataCell(ft.Text(f"{row['max_ms']:.2f}", color="white")),
+                ft.DataCell(ft.Text(f"{row['total_ms']:.0f}", color="white")),
+                ft.DataCell(ft.Text(f"{row['touched']:.1f}", color="white")),
+            ])
+            for row in PROFILER.rows()
+        ]
+        self.diagnostics_summary.value = (
+            f"Обновлений страницы: {PROFILER.update_calls}, "
+            f"контролов за обновление: {PROFILER.flush_sizes.mean:.1f} (макс {PROFILER.flush_sizes.max:.0f})\n"
+            f"Старт сессии: {self.startup.summary()}"
+        )
+        self.batcher.mark_dirty(self.diagnostics_table, self.diagnostics_summary)
+    
+    def refresh_reports(self, now: Optional[datetime.datetime] = None):
+        # Открытый экран отчётов подхватывает новые оплаты; без них запрос отдаёт кеш
+        if (now is not None and self.current_view != "reports") or self.reports_view is None:
+            return
+        self.reports_view.refresh()
+    
+    @ui_handler
+    def _dump_diagnostics(self, e):
+        PROFILER.dump()
+        self.show_snackbar("Диагностика записана в лог")
+    
+    @ui_handler
+    def _reset_diagnostics(self, e):
+        PROFILER.reset()
+        self.refresh_diagnostics()
+    
+    @ui_handler
+    def _on_keyboard(self, e: ft.KeyboardEvent):
+        if e.ctrl and e.shift and e.key.upper() == "D":
+            self.diagnostics_tile.visible = not self.diagnostics_tile.visible
+            self.batcher.mark_dirty(self.diagnostics_tile)
+            if not self.diagnostics_tile.visible and self.current_view == "diagnostics":
+                self.switch_view("tables")
+    
+    def _board_width(self) -> float:
+        # Ширина окна минус боковое меню и отступы основной области и доски
+        return (self.page.width or self.page.window_width or 1366) - 240 - 40 - 40
+    
+    @ui_handler
+    def _on_page_resized(self, e):
+        self.board.resize(self._board_width(), self.page.height)
     
     def _create_table_menu_items(self):
         items = [
@@ -629,6 +1724,67 @@ class BilliardApp:
             ft.PopupMenuItem(),
         ]
         
+        if self.selected_table:
+            for key, tariff in TARIFFS.items():
+                items.append(
+                    ft.PopupMenuItem(
+                        content=ft.Text(f"Тариф: {tariff.name}", color="white"),
+                        checked=self.selected_table.tariff_key == key,
+                        on_click=lambda e, key=key: self.change_table_tariff(key)
+                    )
+                )
+            items.append(ft.PopupMenuItem())
+            items.append(
+                ft.PopupMenuItem(
+                    content=ft.Text("Забронировать...", color="white"),
+                    on_click=self.reserve_table,
+                    icon=ft.icons.EVENT
+                )
+            )
+            if self.selected_table.reservation is not None:
+                items.append(
+                    ft.PopupMenuItem(
+                        content=ft.Text("Отменить бронь", color="white"),
+                        on_click=self.cancel_reservation,
+                        icon=ft.icons.EVENT_BUSY
+                    )
+                )
+        
+        items.append(
+            ft.PopupMenuItem(
+                content=ft.Text("Свободные столы...", color="white"),
+                on_click=self.find_free_tables,
+                icon=ft.icons.EVENT_AVAILABLE
+            )
+        )
+        items.append(ft.PopupMenuItem())
+        
+        # Пакетные действия: над выбранными столами в режиме множественного выбора, иначе над всем залом
+        _, scope = self._bulk_targets()
+        items.extend([
+            ft.PopupMenuItem(
+                content=ft.Text(f"Закрыть аренды: {scope}", color="white"),
+                on_click=self.close_rentals,
+                icon=ft.icons.RECEIPT_LONG
+            ),
+            ft.PopupMenuItem(
+                content=ft.Text(f"На обслуживание: {scope}", color="white"),
+                on_click=lambda e: self.bulk_status(TableStatus.MAINTENANCE),
+                icon=ft.icons.BUILD
+            ),
+            ft.PopupMenuItem(
+                content=ft.Text(f"Освободить: {scope}", color="white"),
+                on_click=lambda e: self.bulk_status(TableStatus.AVAILABLE),
+                icon=ft.icons.CHECK_CIRCLE_OUTLINE
+            ),
+            ft.PopupMenuItem(
+                content=ft.Text(f"Снять брони: {scope}", color="white"),
+                on_click=self.clear_reservations,
+                icon=ft.icons.EVENT_BUSY
+            ),
+            ft.PopupMenuItem(),
+        ])
+        
         if self.selected_table and self.selected_table.status == TableStatus.OCCUPIED:
             items.append(
                 ft.PopupMenuItem(
@@ -649,33 +1805,168 @@ class BilliardApp:
         
         return items
     
+    @property
+    def tables(self):
+        return self.state.snapshot.tables
+    
+    @property
+    def selected_table(self) -> Optional[TableState]:
+        return self.tables.get(self.selected_number)
+    
+    def _last_selected(self) -> Optional[TableState]:
+        return self.tables.get(next(reversed(self.selected_tables), None))
+    
+    @ui_handler
+    @PROFILER.instrument("select_table")
+    def select_table(self, table: TableState):
+        if self.multi_select:
+            if table.number in self.selected_tables:
+                del self.selected_tables[table.number]
+                self.board.refresh(table.number)
+                # Текущим становится последний из оставшихся выбранных, только если сняли сам текущий
+                current = self._last_selected() if table.number == self.selected_number else self.selected_table
+                self.update_table_info(current)
+                return
+        else:
+            previous = [number for number in self.selected_tables if number != table.number]
+            self.selected_tables.clear()
+            for number in previous:
+                self.board.refresh(number)
+        
+        self.selected_tables[table.number] = None
+        self.board.refresh(table.number)
+        self.update_table_info(table)
+    
+    def clear_selection(self):
+        previous = list(self.selected_tables)
+        self.selected_tables.clear()
+        for number in previous:
+            self.board.refresh(number)
+        self.update_table_info(None)
+    
+    @ui_handler
+    def toggle_multi_select(self, e):
+        self.multi_select = not self.multi_select
+        e.control.selected = self.multi_select
+        self.batcher.mark_dirty(e.control)
+        # Пакетные действия меню переключаются между выбранными столами и всем залом
+        if len(self.selected_tables) > 1:
+            self.refresh_table_menu()
+        if not self.multi_select:
+            # Выходя из режима, оставляем выбранным только текущий стол
+            for number in list(self.selected_tables):
+                if number != self.selected_number:
+                    del self.selected_tables[number]
+                    self.board.refresh(number)
+    
     def _create_info_row(self, label: str, value: str, bold: bool = False):
         return ft.Row(
             controls=[
                 ft.Text(label, size=16, width=120, color="#BDBDBD"),
-                ft.Text(value, size=16, weight=ft.FontWeight.BOLD if bold else None, color="white")
+                ft.Text(value, size=16, weight=ft.FontWeight.BOLD if bold else None,
+                        font_family=FONT_FAMILY_BOLD if bold else None, color="white")
             ],
             spacing=10,
             vertical_alignment=ft.CrossAxisAlignment.CENTER
         )
     
-    def initialize_tables(self):
-        for i in range(1, 9):
-            status = TableStatus.AVAILABLE
-            if i % 3 == 0: status = TableStatus.OCCUPIED
-            
-            table = BilliardTable(
-                app=self,
-                number=i,
-                status=status
-            )
-            if status == TableStatus.OCCUPIED:
-                table.start_time = datetime.datetime.now() - datetime.timedelta(minutes=random.randint(5, 120))
-            
-            self.tables.append(table)
+    def initialize_tables(self, count: int = 8):
+        # Столы загружает первая сессия; виджеты строит доска для видимых рядов
+        self.hub.load_tables(count)
+        self.board.set_tables(table.number for table in self.tables)
+    
+    def receive_deltas(self, deltas):
+        # Вызывается в потоке состояния: копим дельты и применяем их в цикле событий страницы
+        with self._deltas_lock:
+            self._deltas.extend(deltas)
+            if self._deltas_scheduled:
+                return
+            self._deltas_scheduled = True
+        self.page.run_task(self._apply_deltas_later)
+    
+    async def _apply_deltas_later(self):
+        # Ждём окно кадра: сессия-источник успевает отрисовать изменение сама, а пачка дельт - накопиться
+        await asyncio.sleep(self.batcher.window)
+        self.page.run_thread(self._apply_pending_deltas)
+    
+    def _apply_pending_deltas(self):
+        with self._deltas_lock:
+            deltas = self._deltas
+            self._deltas = []
+            self._deltas_scheduled = False
+        try:
+            with self.batcher.ui_lock:
+                self.apply_deltas(deltas)
+        except Exception as e:
+            logging.error(f"Error applying state deltas: {e}")
+    
+    @PROFILER.instrument("apply_deltas")
+    def apply_deltas(self, deltas):
+        """Догоняет изменения, сделанные этой или другими сессиями.
+        
+        Дельта говорит только, что изменилось; значение берётся из текущего
+        снимка, поэтому несколько дельт одного стола схлопываются, а то, что
+        сессия уже отрисовала сама, повторно не отправляется.
+        """
+        tables = self.tables
+        changed, added, removed, stock = set(), [], set(), set()
+        for delta in deltas:
+            if delta.kind == "table":
+                changed.add(delta.key)
+            elif delta.kind == "table_added":
+                added.append(delta.key)
+            elif delta.kind == "table_removed":
+                removed.add(delta.key)
+            elif delta.kind == "stock":
+                stock.add(delta.key)
+        
+        if added or removed:
+            known = set(self.board.numbers)
+            numbers = [n for n in self.board.numbers if n not in removed and tables.get(n) is not None]
+            numbers.extend(n for n in added if n not in known and tables.get(n) is not None)
+            if numbers != self.board.numbers:
+                self.board.set_tables(numbers)
+            for number in removed:
+                self.selected_tables.pop(number, None)
         
-        self.board_container.content.controls = self.tables
-        self.board_container.update()
+        orders = self._dialogs.get(OrderDialog)
+        if orders is not None:
+            for number in changed.union(added, removed):
+                orders.track(number, tables.get(number))
+        
+        for number in changed:
+            view = self.board.view_for(number)
+            table = tables.get(number)
+            if view is not None and table is not None and view.model is not table:
+                view.bind(table)
+                self.batcher.mark_dirty(view)
+        
+        selected = self.selected_table
+        if self.selected_number is not None and selected is None:
+            # Текущий стол удалили в другой сессии
+            self.update_table_info(self._last_selected())
+        elif selected is not None and selected is not self._info_table:
+            self.update_table_info(selected)
+        
+        for name in stock:
+            card = self.product_cards.get(name)
+            if card is not None:
+                card.refresh_stock()
+        if stock:
+            self.refresh_low_stock()
+    
+    @ui_handler
+    def resync(self):
+        # После переподключения дельты за время отсутствия потеряны: сверяемся со снимком целиком
+        tables = self.tables
+        for number in [n for n in self.selected_tables if tables.get(n) is None]:
+            del self.selected_tables[number]
+        self.board.set_tables(table.number for table in tables)
+        self.update_table_info(self.selected_table or self._last_selected())
+        for card in self.product_cards.values():
+            card.refresh_stock()
+        self.refresh_low_stock()
+        self.update_timers(datetime.datetime.now())
     
     def clock_display(self):
         self.clock = ft.Text(datetime.datetime.now().strftime("%H:%M:%S"), size=16, color="white")
@@ -689,262 +1980,385 @@ class BilliardApp:
             padding=ft.padding.only(right=10)
         )
     
-    def update_clock(self):
-        def update():
-            while True:
-                try:
-                    time.sleep(1)
-                    current_time = datetime.datetime.now().strftime("%H:%M:%S")
-                    current_date = datetime.datetime.now().strftime("%d.%m.%Y")
-                    
-                    if hasattr(self, 'clock') and hasattr(self, 'date_display'):
-                        self.clock.value = current_time
-                        self.date_display.value = current_date
-                        self.clock.update()
-                        self.date_display.update()
-                except Exception as e:
-                    logging.error(f"Error updating clock: {e}")
-                    time.sleep(5)
-        
-        import threading
-        threading.Thread(target=update, daemon=True).start()
+    def update_clock(self, now: datetime.datetime):
+        current_time = now.strftime("%H:%M:%S")
+        current_date = now.strftime("%d.%m.%Y")
+        if self.clock.value != current_time:
+            self.clock.value = current_time
+            self.batcher.mark_dirty(self.clock)
+        if self.date_display.value != current_date:
+            self.date_display.value = current_date
+            self.batcher.mark_dirty(self.date_display)
     
-    def start_cost_updater(self):
-        def update_cost():
-            while True:
-                try:
-                    time.sleep(60)  # Обновляем каждую минуту
-                    for table in self.tables:
-                        if table.status == TableStatus.OCCUPIED and table.start_time:
-                            duration = datetime.datetime.now() - table.start_time
-                            hours = int(duration.total_seconds() // 3600)
-                            minutes = int((duration.total_seconds() % 3600) // 60)
-                            seconds = int(duration.total_seconds() % 60)
-                            
-                            if hasattr(table, 'time_text') and isinstance(table.time_text, ft.Text):
-                                table.time_text.value = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                                table.update()
-                            
-                            if table == self.selected_table:
-                                self.update_table_info(table)
-                except Exception as e:
-                    logging.error(f"Error updating costs: {e}")
-                    time.sleep(5)
+    def update_timers(self, now: datetime.datetime):
+        # Доска и панель стола видны только на вкладке "Столы"
+        if self.current_view != "tables":
+            return
+        self.board.tick_timers(now)
         
-        import threading
-        threading.Thread(target=update_cost, daemon=True).start()
+        table = self.selected_table
+        if table is not None and table.status == TableStatus.OCCUPIED and table.start_time:
+            info = self.table_info_panel.content.controls[2].controls
+            elapsed = format_duration((now - table.start_time).total_seconds())
+            cost = format_money(table.time_cost(now) + table.order_total)
+            for label, value in ((info[2].controls[1], elapsed), (info[3].controls[1], cost)):
+                if label.value != value:
+                    label.value = value
+                    self.batcher.mark_dirty(label)
     
+    @ui_handler
+    @PROFILER.instrument("switch_view")
     def switch_view(self, view_name):
         self.current_view = view_name
         self.main_content.content.controls[0].visible = view_name == "tables"
-        self.main_content.content.controls[1].content = (
-            self.board_container if view_name == "tables" else self.service_view
+        self.main_content.content.controls[1].content = self._view_control(view_name)
+        if view_name == "diagnostics":
+            self.refresh_diagnostics()
+        elif view_name == "reports":
+            self.refresh_reports()
+        elif view_name == "tables":
+            # Пока доска была скрыта, таймеры не обновлялись
+            self.update_timers(datetime.datetime.now())
+        self.batcher.mark_dirty(self.main_content)
+    
+    def _view_control(self, view_name: str) -> ft.Control:
+        if view_name == "tables":
+            return self.board_container
+        if view_name == "service":
+            if self.service_view is None:
+                self._create_service_view()
+            return self.service_view
+        if view_name == "reports":
+            if self.reports_view is None:
+                self.reports_view = ReportsView(self)
+            return self.reports_view.control
+        return self.diagnostics_view
+    
+    @PROFILER.instrument("create_service_view")
+    def _create_service_view(self) -> ft.Column:
+        # Фильтры для бара
+        self.category_filter = ft.Row(
+            controls=[
+                ft.ElevatedButton(
+                    category,
+                    on_click=lambda e, category=category: self.filter_products(category),
+                    height=36,
+                    style=Palette.filter_style(category == self.current_category)
+                )
+                for category in ("Все", "Напитки", "Закуски", "Алкоголь")
+            ],
+            spacing=12,
+            scroll=ft.ScrollMode.AUTO,
+            wrap=True
+        )
+        
+        self.low_stock_text = ft.Text("", size=14, color=Palette.STOCK_LOW, visible=False)
+        
+        # Меню бара
+        self.service_view = ft.Column(
+            controls=[
+                ft.Container(
+                    padding=ft.padding.symmetric(vertical=10, horizontal=20),
+                    content=ft.Column([self.category_filter, self.low_stock_text], spacing=8)
+                ),
+                ft.GridView(
+                    runs_count=4,
+                    max_extent=220,
+                    child_aspect_ratio=0.85,
+                    spacing=15,
+                    run_spacing=15,
+                    padding=20,
+                    expand=True
+                )
+            ],
+            expand=True,
+            spacing=0
         )
-        self.page.update()
+        self._build_product_cards()
+        self.refresh_low_stock()
+        return self.service_view
+    
+    def _build_product_cards(self):
+        grid_view = self.service_view.controls[1]
+        self.category_index = {"Все": []}
+        for item in self.products:
+            card = ProductItem(app=self, item=item)
+            self.product_cards[item.name] = card
+            self.category_index["Все"].append(card)
+            self.category_index.setdefault(item.category, []).append(card)
+        grid_view.controls = list(self.category_index["Все"])
     
+    def refresh_low_stock(self, limit: int = 5):
+        if self.service_view is None:
+            # Бар ещё не открывали: баннер посчитается при его построении
+            return
+        low = self.state.low_stock()
+        names = ", ".join(f"{name} ({stock})" for name, stock in low[:limit])
+        if len(low) > limit:
+            names += f" и ещё {len(low) - limit}"
+        value = f"Заканчивается: {names}" if low else ""
+        if self.low_stock_text.value != value:
+            self.low_stock_text.value = value
+            self.low_stock_text.visible = bool(low)
+            self.batcher.mark_dirty(self.low_stock_text)
+    
+    @ui_handler
+    @PROFILER.instrument("filter_products")
     def filter_products(self, category: str):
+        previous = self.current_category
         self.current_category = category
-        grid_view = self.service_view.controls[1]
-        grid_view.controls.clear()
-        
-        for product in self.products:
-            if category == "Все" or product["category"] == category:
-                grid_view.controls.append(
-                    ProductItem(
-                        app=self,
-                        name=product["name"],
-                        price=product["price"],
-                        stock=product["stock"],
-                        category=product["category"]
-                    )
-                )
+        if category == previous:
+            return
+        
+        # Карточки не пересоздаются: меняем только видимость тех, что её поменяли
+        shown = {id(card) for card in self.category_index.get(category, [])}
+        for card in self.product_cards.values():
+            visible = id(card) in shown
+            if card.visible != visible:
+                card.visible = visible
+                self.batcher.mark_dirty(card)
         
         # Обновляем состояние кнопок фильтров
         for btn in self.category_filter.controls:
-            btn.bgcolor = (
-                {"": "#42A5F5", "hovered": "#1E88E5"} 
-                if btn.text == category 
-                else {"": ft.colors.with_opacity(0.3, "#424242"), "hovered": ft.colors.with_opacity(0.5, "#424242")}
-            )
-            btn.update()
-        
-        self.page.update()
+            if btn.text in (category, previous):
+                btn.style = Palette.filter_style(btn.text == category)
+                self.batcher.mark_dirty(btn)
     
-    def update_table_info(self, table: Optional[BilliardTable] = None):
-        self.selected_table = table
+    @PROFILER.instrument("update_table_info")
+    def update_table_info(self, table: Optional[TableState] = None):
+        self.selected_number = table.number if table else None
+        self._info_table = table
         info = self.table_info_panel.content.controls[2].controls
         
         if table:
             info[0].controls[1].value = f"{table.number}"
             info[1].controls[1].value = table.status.value
-            info[1].controls[1].color = table.status_colors[table.status]
+            info[1].controls[1].color = BilliardTable.status_colors[table.status]
             
             if table.status == TableStatus.OCCUPIED and table.start_time:
-                duration = datetime.datetime.now() - table.start_time
-                hours = int(duration.total_seconds() // 3600)
-                minutes = int((duration.total_seconds() % 3600) // 60)
-                seconds = int(duration.total_seconds() % 60)
-                info[2].controls[1].value = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                
-                # 10 руб за каждую минуту
-                cost = (duration.total_seconds() / 60) * table.current_tariff
-                cost += sum(p['price'] for p in table.products)
-                info[3].controls[1].value = f"{cost:.2f} ₽"
-                
-                products_list = info[4].content
-                products_list.controls.clear()
-                for product in table.products:
-                    products_list.controls.append(
-                        ft.Text(f"• {product['name']} - {product['price']:.2f} ₽", size=14, color="white")
-                    )
-                info[4].content.update()
+                now = datetime.datetime.now()
+                info[2].controls[1].value = format_duration((now - table.start_time).total_seconds())
+                info[3].controls[1].value = format_money(table.time_cost(now) + table.order_total)
+                self.order_view.show(table)
             else:
                 info[2].controls[1].value = "-"
                 info[3].controls[1].value = "-"
-                info[4].content.controls.clear()
-                info[4].content.update()
+                self.order_view.show(None)
+            info[4].controls[1].value = table.reservation.describe() if table.reservation else "-"
         else:
-            for row in info[:4]:
+            for row in info[:5]:
                 row.controls[1].value = "-"
                 row.controls[1].color = None
-            info[4].content.controls.clear()
-            info[4].content.update()
+            self.order_view.show(None)
         
-        # Обновляем меню
-        self.table_info_panel.content.controls[0].controls[2].items = self._create_table_menu_items()
-        self.table_info_panel.update()
-        self.page.update()
+        # Отправляем только строки значений и меню, а не всю панель
+        self.batcher.mark_dirty(*(row.controls[1] for row in info[:5]))
+        self.refresh_table_menu()
     
+    def refresh_table_menu(self):
+        menu = self.table_info_panel.content.controls[0].controls[3]
+        menu.items = self._create_table_menu_items()
+        self.batcher.mark_dirty(menu)
+    
+    @ui_handler
+    @PROFILER.instrument("change_table_status")
     def change_table_status(self, status: TableStatus):
         if self.selected_table:
-            self.selected_table.status = status
-            
-            if status == TableStatus.OCCUPIED:
-                self.selected_table.start_time = datetime.datetime.now()
-                self.selected_table.client_name = "Гость"
-            else:
-                self.selected_table.start_time = None
-                self.selected_table.client_name = ""
-                if status != TableStatus.RESERVED:
-                    self.selected_table.products = []
-            
+            table = self.state.set_status(self.selected_number, status)
             # Обновляем отображение стола
-            self.selected_table.update_status_display()
-            self.update_table_info(self.selected_table)
-            self.show_snackbar(f"Статус стола {self.selected_table.number} изменен на {status.value}")
+            self.board.refresh(table.number)
+            self.update_table_info(table)
+            if table.status != status:
+                # Освобождённый стол сразу вернулся в бронь: сообщаем итоговый статус
+                self.show_snackbar(f"Стол {table.number} забронирован, статус: {table.status.value}")
+            else:
+                self.show_snackbar(f"Статус стола {table.number} изменен на {table.status.value}")
     
+    @ui_handler
+    def change_table_tariff(self, tariff_key: str):
+        if self.selected_table:
+            table = self.state.set_tariff(self.selected_number, tariff_key)
+            self.update_table_info(table)
+            self.show_snackbar(f"Тариф стола {table.number}: {TARIFFS[tariff_key].name}")
+    
+    @ui_handler
+    @PROFILER.instrument("stop_rental")
     def stop_rental(self, e):
         if not self.selected_table or self.selected_table.status != TableStatus.OCCUPIED:
             self.show_snackbar("Выберите занятый стол")
             return
-
-        def close_dlg(e):
-            dlg_modal.open = False
-            self.page.update()
-            # После закрытия диалога меняем статус стола
-            self.change_table_status(TableStatus.AVAILABLE)
-
-        duration = datetime.datetime.now() - self.selected_table.start_time
-        total_seconds = duration.total_seconds()
-        hours = int(total_seconds // 3600)
-        minutes = int((total_seconds % 3600) // 60)
-        seconds = int(total_seconds % 60)
+        self.pooled(ReceiptDialog).open(self.selected_table, datetime.datetime.now())
+    
+    @ui_handler
+    def settle_rental(self, number: int, closed_at: datetime.datetime, bill_key: Optional[tuple] = None):
+        # Сессия закрывается оплатой на момент открытия чека, стол освобождается той же командой
+        try:
+            freed = self.state.settle(number, closed_at, bill_key)
+        except StaleReceipt as error:
+            # Клиенту показываем актуальный счёт, оплата - уже по нему
+            self.pooled(ReceiptDialog).open(self.tables.get(number), datetime.datetime.now())
+            self.show_snackbar(str(error))
+            return
+        except ValueError as error:
+            self.show_snackbar(str(error))
+            return
+        self.board.refresh(freed.number)
+        if freed.number == self.selected_number:
+            self.update_table_info(freed)
+        self.show_snackbar(f"Статус стола {freed.number} изменен на {freed.status.value}")
+    
+    def _bulk_targets(self) -> tuple:
+        """Номера столов для пакетного действия и подпись для меню."""
+        if self.multi_select and len(self.selected_tables) > 1:
+            numbers = [number for number in self.selected_tables if self.tables.get(number) is not None]
+            return numbers, f"выбранные ({len(numbers)})"
+        return sorted(table.number for table in self.tables), "весь зал"
+    
+    def _refresh_bulk(self, numbers):
+        # Все плитки и панель уходят клиенту одним патчем батчера
+        for number in numbers:
+            self.board.refresh(number)
+        if self.selected_number in numbers:
+            self.update_table_info(self.selected_table)
+        else:
+            self.refresh_table_menu()
+    
+    @ui_handler
+    def close_rentals(self, e):
+        numbers, _ = self._bulk_targets()
+        occupied = [table for table in map(self.tables.get, numbers)
+                    if table is not None and table.status == TableStatus.OCCUPIED]
+        if not occupied:
+            self.show_snackbar("Нет занятых столов")
+            return
+        self.pooled(BulkReceiptDialog).open(occupied, datetime.datetime.now())
+    
+    @ui_handler
+    @PROFILER.instrument("settle_rentals")
+    def settle_rentals(self, numbers: list, closed_at: datetime.datetime, bill_keys: Optional[dict] = None):
+        paid = self.state.settle_many(numbers, closed_at, bill_keys)
+        self._refresh_bulk([table.number for table in paid])
+        total = sum(table.time_cost(closed_at) + table.order_total for table in paid)
+        message = f"Оплачено столов: {len(paid)} на {format_money(total)}"
+        if len(paid) < len(numbers):
+            # Часть столов успели оплатить, освободить или дозаказать в другой сессии
+            message += f", пропущены (закрыты или счёт изменился): {len(numbers) - len(paid)}"
+        self.show_snackbar(message)
+    
+    @ui_handler
+    def bulk_status(self, status: TableStatus):
+        numbers, scope = self._bulk_targets()
         
-        time_cost = (total_seconds / 60) * self.selected_table.current_tariff
-        products_cost = sum(p['price'] for p in self.selected_table.products)
-        total_cost = time_cost + products_cost
+        def confirm():
+            self.close_dialog()
+            changed = self.state.set_status_many(numbers, status)
+            self._refresh_bulk([table.number for table in changed])
+            busy = sum(1 for number in numbers
+                       if (table := self.tables.get(number)) is not None and table.status == TableStatus.OCCUPIED)
+            # Освобождённые столы с наступившей бронью сразу возвращаются в "Бронь"
+            held = sum(1 for table in changed if table.status != status)
+            message = f"{status.value}: столов {len(changed) - held}"
+            if held:
+                message += f", вернулись в бронь: {held}"
+            if busy:
+                message += f", занятые пропущены: {busy}"
+            self.show_snackbar(message)
         
-        receipt_content = ft.Column(
-            controls=[
-                ft.Text("Чек", size=24, weight=ft.FontWeight.BOLD, color="white"),
-                ft.Divider(color=ft.colors.with_opacity(0.1, "#FFFFFF")),
-                ft.Text(f"Стол: {self.selected_table.number}", size=18, color="white"),
-                ft.Text(f"Время: {hours:02d}:{minutes:02d}:{seconds:02d}", size=16, color="white"),
-                ft.Text(f"Тариф: {self.selected_table.current_tariff} руб/мин", size=16, color="white"),
-                ft.Text(f"Стоимость времени: {time_cost:.2f} ₽", size=16, color="white"),
-                ft.Text("Товары:", size=16, weight=ft.FontWeight.BOLD, color="white"),
-                *[ft.Text(f"- {p['name']}: {p['price']:.2f} ₽", color="white") for p in self.selected_table.products],
-                ft.Divider(color=ft.colors.with_opacity(0.1, "#FFFFFF")),
-                ft.Text(f"Итого: {total_cost:.2f} ₽", size=20, weight=ft.FontWeight.BOLD, color="#4CAF50"),
-            ],
-            spacing=10
-        )
-
-        dlg_modal = ft.AlertDialog(
-            modal=True,
-            title=ft.Text("Оплата аренды"),
-            content=ft.Container(
-                content=receipt_content,
-                padding=10
-            ),
-            actions=[
-                ft.TextButton("Закрыть", on_click=close_dlg),
-            ],
-            actions_alignment=ft.MainAxisAlignment.END,
+        self.pooled(ConfirmDialog).open(
+            f"{status.value}: {scope}",
+            f"Перевести в статус \"{status.value}\" столов: {len(numbers)}? Занятые столы не меняются.",
+            confirm
         )
-
-        def open_dlg_modal(e):
-            self.page.dialog = dlg_modal
-            dlg_modal.open = True
-            self.page.update()
-
-        open_dlg_modal(e)
     
+    @ui_handler
+    def clear_reservations(self, e):
+        numbers, scope = self._bulk_targets()
+        # Книгу броней меняет поток состояния; здесь хватает снимка: у стола есть бронь или нет
+        reserved = [number for number in numbers
+                    if (table := self.tables.get(number)) is not None and table.reservation is not None]
+        if not reserved:
+            self.show_snackbar("Броней нет")
+            return
+        
+        def confirm():
+            self.close_dialog()
+            cancelled = self.state.cancel_reservations(reserved)
+            self._refresh_bulk(sorted({reservation.table for reservation in cancelled}))
+            self.show_snackbar(f"Снято броней: {len(cancelled)}")
+        
+        self.pooled(ConfirmDialog).open(f"Снять брони: {scope}", f"Отменить все брони столов: {len(reserved)}?", confirm)
+    
+    @ui_handler
     def remove_table(self, e):
         if not self.selected_table:
             self.show_snackbar("Выберите стол для удаления")
             return
 
-        def confirm_delete(e):
-            table_to_remove = self.selected_table
-            self.tables.remove(table_to_remove)
-            self.selected_table = None
-            self.update_table_info(None)
-            self.board_container.content.controls = self.tables
-            self.board_container.update()
-            self.show_snackbar(f"Удален стол {table_to_remove.number}")
-            dlg_modal.open = False
-            self.page.update()
-
-        def close_dlg(e):
-            dlg_modal.open = False
-            self.page.update()
-
-        dlg_modal = ft.AlertDialog(
-            modal=True,
-            title=ft.Text("Подтверждение удаления"),
-            content=ft.Text(f"Вы уверены, что хотите удалить стол {self.selected_table.number}?"),
-            actions=[
-                ft.TextButton("Да", on_click=confirm_delete),
-                ft.TextButton("Нет", on_click=close_dlg),
-            ],
-            actions_alignment=ft.MainAxisAlignment.END,
-        )
+        number = self.selected_number
 
-        def open_dlg_modal(e):
-            self.page.dialog = dlg_modal
-            dlg_modal.open = True
-            self.page.update()
+        def confirm_delete():
+            try:
+                self.state.remove_table(number)
+            except ValueError as error:
+                self.show_snackbar(str(error))
+                return
+            self.selected_tables.pop(number, None)
+            self.update_table_info(self._last_selected())
+            self.board.remove(number)
+            self.show_snackbar(f"Удален стол {number}")
+            self.close_dialog()
 
-        open_dlg_modal(e)
+        self.pooled(ConfirmDialog).open(
+            "Подтверждение удаления", f"Вы уверены, что хотите удалить стол {number}?", confirm_delete
+        )
+    
+    @ui_handler
+    def reserve_table(self, e):
+        if not self.selected_table:
+            self.show_snackbar("Выберите стол для брони")
+            return
+        self.pooled(ReservationDialog).open(self.selected_number)
+    
+    @ui_handler
+    def cancel_reservation(self, e):
+        table = self.selected_table
+        if table is None or table.reservation is None:
+            self.show_snackbar("У стола нет брони")
+            return
+        reservation = self.state.cancel_reservation(table.reservation.id)
+        self.board.refresh(table.number)
+        self.update_table_info(self.tables.get(table.number))
+        if reservation is not None:
+            self.show_snackbar(f"Бронь стола {table.number} отменена: {reservation.describe()}")
+    
+    @ui_handler
+    def find_free_tables(self, e):
+        self.pooled(FreeTablesDialog).open()
+    
+    def pooled(self, dialog_class):
+        # Диалог из пула: строится при первом открытии и дальше переиспользуется
+        dialog = self._dialogs.get(dialog_class)
+        if dialog is None:
+            dialog = self._dialogs[dialog_class] = dialog_class(self)
+        return dialog
     
     def close_dialog(self):
-        if hasattr(self.page, 'dialog'):
-            self.page.dialog.open = False
-            self.page.update()
+        if self.active_dialog is not None:
+            self.active_dialog.close()
     
+    @ui_handler
     def show_snackbar(self, message: str):
-        self.page.snack_bar = ft.SnackBar(
-            content=ft.Text(message, color="white"),
-            bgcolor="#424242",
-            behavior=ft.SnackBarBehavior.FLOATING,
-            elevation=10,
-            shape=ft.RoundedRectangleBorder(radius=10)
-        )
-        self.page.snack_bar.open = True
-        self.page.update()
+        # Снекбары по очереди: новое сообщение не теряется, пока предыдущее ещё на экране
+        self._snack_index = (self._snack_index + 1) % len(self.snack_bars)
+        snack = self.snack_bars[self._snack_index]
+        snack.content.value = message
+        snack.open = True
+        self.batcher.mark_dirty(snack)
 
 def main(page: ft.Page):
     app = BilliardApp(page)
 
-ft.app(target=main)
\ No newline at end of file
+if __name__ == "__main__":
+    # Логи пишутся в фоновом потоке и не задерживают обработчики
+    setup_logging()
+    ft.app(target=main, assets_dir=ASSETS_DIR)
\ No newline at end of file
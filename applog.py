@@ -0,0 +1,114 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Optional
+
+LOG_PATH = "billiard_app.log"
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+events_logger = logging.getLogger("billiard.events")
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Ротация по времени (по умолчанию в полночь) и дополнительно по размеру файла."""
+
+    def __init__(self, filename: str, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if super().shouldRollover(record):
+            return 1
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, 2)
+            if self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes:
+                return 1
+        return 0
+
+    def rotation_filename(self, default_name: str) -> str:
+        # При ротации по размеру в пределах суток имя с датой уже может быть занято
+        name, n = default_name, 1
+        while os.path.exists(name):
+            name = f"{default_name}.{n}"
+            n += 1
+        return name
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись - один JSON-объект в строке; поля бизнес-событий лежат на верхнем уровне."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+            entry.update(getattr(record, "fields", {}))
+        # Через очередь трассировка приходит уже строкой в exc_text
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    path: str = LOG_PATH,
+    json_lines: Optional[bool] = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 14,
+    when: str = "midnight",
+    level: int = logging.INFO,
+) -> QueueListener:
+    """Настраивает неблокирующее логирование.
+
+    Обработчики UI только кладут запись в очередь (QueueHandler); запись на
+    диск и ротацию выполняет отдельный поток QueueListener. Формат JSON Lines
+    включается параметром или переменной окружения BILLIARD_LOG_FORMAT=json.
+    """
+    if json_lines is None:
+        json_lines = os.environ.get("BILLIARD_LOG_FORMAT", "").lower() == "json"
+
+    file_handler = SizedTimedRotatingFileHandler(
+        path, max_bytes=max_bytes, when=when, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_EventQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class _EventQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование откладывается до потока записи; здесь только фиксируем
+        # аргументы, чтобы запись не зависела от изменяемых объектов UI
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Трассировка только в exc_text: текстовый Formatter допишет её к сообщению сам
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def log_event(event: str, **fields):
+    """Структурная запись бизнес-события: старт сессии, заказ, оплата и т. п."""
+    details = " ".join(f"{key}={value}" for key, value in fields.items())
+    events_logger.info(f"{event} {details}".rstrip(), extra={"event": event, "fields": fields})
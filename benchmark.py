@@ -0,0 +1,366 @@
+"""Безголовый бенчмарк горячих обработчиков BilliardApp.
+
+Приложение запускается на настоящем ft.Page, подключённом к записывающему
+соединению вместо клиента: каждый пакет команд сериализуется так же, как
+при отправке по websocket, и учитывается его размер. Результаты пишутся в
+JSON-отчёт, который можно сравнивать между ревизиями.
+
+    python benchmark.py --sizes 8 100 1000 --output benchmark_report.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+import flet as ft
+from flet_core.local_connection import LocalConnection
+from flet_core.protocol import (
+    ClientActions,
+    ClientMessage,
+    CommandEncoder,
+    PageCommandResponsePayload,
+    PageCommandsBatchResponsePayload,
+)
+
+from app import BilliardApp, TableStatus
+from hub import ClubHub
+from journal import Journal, sidecar_path
+from ledger import Ledger
+from state import TableState
+from storage import Storage
+
+CATEGORIES = ("Напитки", "Закуски", "Алкоголь")
+
+
+class RecordingConnection(LocalConnection):
+    """Соединение без клиента: выдаёт id контролам и считает отправленные патчи."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = 0
+        self.bytes = 0
+
+    def send_command(self, session_id: str, command):
+        result, message = self._process_command(command)
+        if message:
+            self._record([message])
+        return PageCommandResponsePayload(result=result, error="")
+
+    def send_commands(self, session_id: str, commands):
+        results = []
+        messages = []
+        for command in commands:
+            result, message = self._process_command(command)
+            if command.name in ("add", "get"):
+                results.append(result)
+            if message:
+                messages.append(message)
+        if messages:
+            self._record(messages)
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+    def _record(self, messages):
+        payload = json.dumps(
+            ClientMessage(ClientActions.PAGE_CONTROLS_BATCH, messages),
+            cls=CommandEncoder,
+            separators=(",", ":"),
+        )
+        self.messages += 1
+        self.bytes += len(payload.encode("utf-8"))
+
+
+class RecordingPage(ft.Page):
+    """ft.Page, который дополнительно считает вызовы update() и затронутые контролы."""
+
+    def __init__(self, conn: RecordingConnection, loop: asyncio.AbstractEventLoop):
+        super().__init__(conn, "benchmark", loop)
+        self.recorder = conn
+        self.update_calls = 0
+        self.updated_controls = 0
+
+    def update(self, *controls):
+        self.update_calls += 1
+        self.updated_controls += len(controls) or 1
+        super().update(*controls)
+
+    def counters(self) -> dict:
+        return {
+            "page_updates": self.update_calls,
+            "controls": self.updated_controls,
+            "messages": self.recorder.messages,
+            "bytes": self.recorder.bytes,
+        }
+
+
+class Measurement:
+    def __init__(self, page: RecordingPage):
+        self.page = page
+        self.samples = []
+        self.totals = {"page_updates": 0, "controls": 0, "messages": 0, "bytes": 0}
+
+    def run(self, action, app: BilliardApp):
+        before = self.page.counters()
+        started = time.perf_counter()
+        # Действие выполняется под UI-блокировкой, как обработчик: фоновые дельты и тики ждут его конца
+        with app.batcher.ui_lock:
+            action()
+            # Батчер отправляет изменения по таймеру; для воспроизводимости сбрасываем его сразу
+            app.batcher.flush()
+        self.samples.append((time.perf_counter() - started) * 1000)
+        after = self.page.counters()
+        for key in self.totals:
+            self.totals[key] += after[key] - before[key]
+
+    def report(self, size: int, handler: str) -> dict:
+        calls = len(self.samples)
+        ordered = sorted(self.samples)
+        return {
+            "size": size,
+            "handler": handler,
+            "calls": calls,
+            "wall_ms_mean": round(statistics.fmean(ordered), 3),
+            "wall_ms_p95": round(ordered[min(calls - 1, int(calls * 0.95))], 3),
+            "wall_ms_max": round(ordered[-1], 3),
+            **{f"{key}_per_call": round(value / calls, 2) for key, value in self.totals.items()},
+        }
+
+
+def make_catalog(size: int) -> list:
+    rng = random.Random(size)
+    return [
+        {
+            "name": f"Товар {i}",
+            "price": float(rng.randint(50, 500)),
+            "stock": 10_000,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+        }
+        for i in range(1, size + 1)
+    ]
+
+
+def run_size(size: int, repeat: int, loop: asyncio.AbstractEventLoop, db_dir: str) -> list:
+    page = RecordingPage(RecordingConnection(), loop)
+    storage = Storage(os.path.join(db_dir, f"bench_{size}.db"))
+    results = []
+    rng = random.Random(size)
+
+    init = Measurement(page)
+    holder = {}
+
+    def construct():
+        holder["app"] = BilliardApp(page, storage=storage, products=make_catalog(size), table_count=size)
+
+    started = time.perf_counter()
+    construct()
+    app = holder["app"]
+    app.scheduler.stop()
+    app.batcher.flush()
+    init.samples.append((time.perf_counter() - started) * 1000)
+    init.totals.update(page.counters())
+    results.append(init.report(size, "initialize_tables"))
+    # Этапы старта: до первого кадра, привязка столов, каталог
+    for stage in app.startup.stages:
+        results.append({
+            "size": size,
+            "handler": f"startup_{stage['stage']}",
+            "calls": 1,
+            "wall_ms_mean": round(stage["at_ms"], 3),
+            "wall_ms_p95": round(stage["at_ms"], 3),
+            "wall_ms_max": round(stage["at_ms"], 3),
+            "page_updates_per_call": 0,
+            "bytes_per_call": 0,
+        })
+
+    numbers = [table.number for table in app.tables]
+    picks = [rng.choice(numbers) for _ in range(repeat)]
+
+    select = Measurement(page)
+    for number in picks:
+        select.run(lambda: app.select_table(app.tables.get(number)), app)
+    results.append(select.report(size, "select_table"))
+
+    info = Measurement(page)
+    for _ in range(repeat):
+        info.run(lambda: app.update_table_info(app.selected_table), app)
+    results.append(info.report(size, "update_table_info"))
+
+    status = Measurement(page)
+    stop = Measurement(page)
+    for number in picks:
+        app.select_table(app.tables.get(number))
+        app.batcher.flush()
+        status.run(lambda: app.change_table_status(TableStatus.OCCUPIED), app)
+        # Чек открывается и подтверждается как одно действие оператора
+        stop.run(lambda: (app.stop_rental(None), app.active_dialog.dialog.actions[0].on_click(None)), app)
+    results.append(status.report(size, "change_table_status"))
+    results.append(stop.report(size, "stop_rental"))
+
+    # Закрытие смены: все аренды зала одной пакетной командой и одним сводным чеком
+    app.state.set_status_many(numbers, TableStatus.OCCUPIED)
+    app.batcher.flush()
+    bulk = Measurement(page)
+    bulk.run(lambda: (app.close_rentals(None), app.active_dialog.confirm(None)), app)
+    results.append(bulk.report(size, "close_rentals_hall"))
+
+    # Первое открытие бара строит карточки каталога
+    first_switch = Measurement(page)
+    first_switch.run(lambda: app.switch_view("service"), app)
+    results.append(first_switch.report(size, "switch_view_service"))
+    filters = Measurement(page)
+    categories = ("Все",) + CATEGORIES
+    for i in range(repeat):
+        filters.run(lambda: app.filter_products(categories[(i + 1) % len(categories)]), app)
+    results.append(filters.report(size, "filter_products"))
+
+    storage.close()
+    return results
+
+
+def run_ledger(days: int, repeat: int, db_dir: str) -> list:
+    """Журнал оплат за days дней (~150 сессий в день): Z-отчёт и суточные итоги за весь период."""
+    ledger = Ledger(os.path.join(db_dir, f"bench_{days}.ledger"))
+    rng = random.Random(days)
+    last = datetime.date.today()
+    first = last - datetime.timedelta(days=days - 1)
+    session_id = 0
+    for offset in range(days):
+        opened = datetime.datetime.combine(first + datetime.timedelta(days=offset), datetime.time(10))
+        for _ in range(150):
+            session_id += 1
+            start = opened + datetime.timedelta(seconds=rng.randint(0, 12 * 3600))
+            end = start + datetime.timedelta(seconds=rng.randint(600, 4 * 3600))
+            ledger.append(session_id, rng.randint(1, 20), start, end,
+                          rng.randint(10_000, 200_000), rng.randint(0, 50_000), rng.randint(0, 6))
+
+    results = []
+    for handler, action in (
+        ("ledger_z_report", lambda: ledger.z_report(last)),
+        ("ledger_daily_year", lambda: ledger.daily(first, last)),
+    ):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            action()
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        results.append({
+            "size": len(ledger),
+            "handler": handler,
+            "calls": repeat,
+            "wall_ms_mean": round(statistics.fmean(samples), 3),
+            "wall_ms_p95": round(samples[min(repeat - 1, int(repeat * 0.95))], 3),
+            "wall_ms_max": round(samples[-1], 3),
+            "page_updates_per_call": 0,
+            "bytes_per_call": 0,
+        })
+    ledger.close()
+    return results
+
+
+def run_recovery(sessions: int, repeat: int, db_dir: str, tables: int = 30, tail: int = 500) -> list:
+    """Смена из sessions аренд за 14 часов, затем падение с tail операциями, не дошедшими до базы.
+
+    Замеряется подъём клуба целиком: открытие хранилища с повтором хвоста
+    журнала и восстановление столов с идущими арендами и заказами.
+    """
+    path = os.path.join(db_dir, f"recovery_{sessions}.db")
+    storage = Storage(path)
+    rng = random.Random(sessions)
+    opened = datetime.datetime.combine(datetime.date.today(), datetime.time(10))
+    for i in range(sessions):
+        started = opened + datetime.timedelta(seconds=14 * 3600 * i // sessions)
+        table = TableState(number=i % tables + 1, status=TableStatus.OCCUPIED, client_name="Гость", start_time=started)
+        session_id = storage.start_session(table)
+        storage.save_table(table)
+        for _ in range(rng.randint(0, 6)):
+            storage.add_order_line(session_id, f"Товар {rng.randint(1, 50)}", rng.randint(50, 500) * 100)
+        # Последние аренды каждого стола ещё идут в момент падения
+        if i < sessions - tables:
+            storage.end_session(session_id, started + datetime.timedelta(minutes=rng.randint(20, 180)), rng.randint(10_000, 200_000))
+            storage.save_table(table._replace(status=TableStatus.AVAILABLE, start_time=None))
+    storage.close()
+
+    samples = []
+    for _ in range(repeat):
+        # Хвост, который писатель не успел зафиксировать: операции есть только в журнале
+        conn = sqlite3.connect(path)
+        committed = conn.execute("SELECT seq FROM journal_checkpoint").fetchone()[0]
+        session_ids = [row[0] for row in conn.execute("SELECT id FROM sessions WHERE ended_at IS NULL")]
+        conn.close()
+        journal = Journal(sidecar_path(path, ".journal"))
+        journal.recover(committed)
+        for _ in range(tail):
+            journal.append([("add_order_line", (rng.choice(session_ids), "Товар 1", 10_000, opened.isoformat()))])
+        journal.close()
+
+        started = time.perf_counter()
+        storage = Storage(path)
+        hub = ClubHub(storage)
+        hub.load_tables(tables)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert storage.recovered == tail
+        hub.ledger.close()
+        storage.close()
+
+    samples.sort()
+    return [{
+        "size": sessions,
+        "handler": "recovery_shift",
+        "calls": repeat,
+        "wall_ms_mean": round(statistics.fmean(samples), 3),
+        "wall_ms_p95": round(samples[min(repeat - 1, int(repeat * 0.95))], 3),
+        "wall_ms_max": round(samples[-1], 3),
+        "page_updates_per_call": 0,
+        "bytes_per_call": 0,
+    }]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--ledger-days", type=int, default=365)
+    parser.add_argument("--recovery-sessions", type=int, default=2000)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    results = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        for size in args.sizes:
+            results.extend(run_size(size, args.repeat, loop, db_dir))
+        results.extend(run_ledger(args.ledger_days, args.repeat, db_dir))
+        results.extend(run_recovery(args.recovery_sessions, args.repeat, db_dir))
+
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "flet": ft.version.version,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'size':>6} {'handler':<20} {'mean ms':>9} {'p95 ms':>9} {'updates':>8} {'bytes':>10}")
+    for row in results:
+        print(
+            f"{row['size']:>6} {row['handler']:<20} {row['wall_ms_mean']:>9} {row['wall_ms_p95']:>9} "
+            f"{row['page_updates_per_call']:>8} {row['bytes_per_call']:>10}"
+        )
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
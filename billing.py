@@ -0,0 +1,168 @@
+import bisect
+import datetime
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+# Все суммы хранятся в копейках целыми числами
+KOPECKS_PER_RUBLE = 100
+
+WEEK_SECONDS = 7 * 24 * 3600
+DAY_SECONDS = 24 * 3600
+# Понедельник, от которого отсчитываются секунды недели
+_EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def to_kopecks(rubles: float) -> int:
+    return int(round(rubles * KOPECKS_PER_RUBLE))
+
+
+def format_money(kopecks: int) -> str:
+    sign = "-" if kopecks < 0 else ""
+    kopecks = abs(kopecks)
+    return f"{sign}{kopecks // KOPECKS_PER_RUBLE}.{kopecks % KOPECKS_PER_RUBLE:02d} ₽"
+
+
+class TariffSchedule:
+    """Недельное расписание тарифа.
+
+    Неделя разбита на отрезки со своей ценой минуты (в копейках). Для начала
+    каждого отрезка заранее посчитана накопленная стоимость с начала недели,
+    поэтому стоимость любого интервала - разность двух значений накопленной
+    функции, каждое из которых ищется бинарным поиском за O(log отрезков).
+    """
+
+    def __init__(self, name: str, segments: Iterable[Tuple[int, int]]):
+        segments = sorted(segments)
+        if not segments or segments[0][0] != 0:
+            raise ValueError("Расписание должно начинаться с начала недели")
+        self.name = name
+        self._starts = [start for start, _ in segments]
+        self._rates = [rate for _, rate in segments]
+        # Накопленная стоимость в "копейко-секундах за минуту": делится на 60 в конце
+        self._prefix = [0]
+        for i in range(1, len(segments)):
+            self._prefix.append(self._prefix[-1] + self._rates[i - 1] * (self._starts[i] - self._starts[i - 1]))
+        self._week_total = self._prefix[-1] + self._rates[-1] * (WEEK_SECONDS - self._starts[-1])
+
+    @classmethod
+    def flat(cls, name: str, rate: int) -> "TariffSchedule":
+        return cls(name, [(0, rate)])
+
+    @classmethod
+    def peak_hours(cls, name: str, off_peak: int, peak: int, weekend: int,
+                   peak_from: int = 18, peak_to: int = 24) -> "TariffSchedule":
+        """Будни: дневной тариф и вечерний пик с peak_from до peak_to часов; выходные - отдельный тариф."""
+        segments = []
+        for day in range(5):
+            day_start = day * DAY_SECONDS
+            segments.append((day_start, off_peak))
+            segments.append((day_start + peak_from * 3600, peak))
+            if peak_to < 24:
+                segments.append((day_start + peak_to * 3600, off_peak))
+        segments.append((5 * DAY_SECONDS, weekend))
+        # Склеиваем соседние отрезки с одинаковой ценой
+        merged = []
+        for start, rate in sorted(segments):
+            if merged and merged[-1][1] == rate:
+                continue
+            merged.append((start, rate))
+        return cls(name, merged)
+
+    def _cumulative(self, moment: datetime.datetime) -> int:
+        seconds = int((moment - _EPOCH).total_seconds())
+        weeks, offset = divmod(seconds, WEEK_SECONDS)
+        i = bisect.bisect_right(self._starts, offset) - 1
+        return weeks * self._week_total + self._prefix[i] + self._rates[i] * (offset - self._starts[i])
+
+    def cost(self, start: datetime.datetime, end: datetime.datetime) -> int:
+        """Стоимость интервала в копейках с округлением до копейки."""
+        if end <= start:
+            return 0
+        return (self._cumulative(end) - self._cumulative(start) + 30) // 60
+
+    def rate_at(self, moment: datetime.datetime) -> int:
+        offset = int((moment - _EPOCH).total_seconds()) % WEEK_SECONDS
+        return self._rates[bisect.bisect_right(self._starts, offset) - 1]
+
+    def describe(self, moment: datetime.datetime) -> str:
+        return f"{self.name}, сейчас {format_money(self.rate_at(moment))}/мин"
+
+
+TARIFFS = {
+    "base": TariffSchedule.flat("Базовый", 10 * KOPECKS_PER_RUBLE),
+    "peak": TariffSchedule.peak_hours(
+        "Пик/выходные",
+        off_peak=10 * KOPECKS_PER_RUBLE,
+        peak=14 * KOPECKS_PER_RUBLE,
+        weekend=12 * KOPECKS_PER_RUBLE,
+    ),
+}
+DEFAULT_TARIFF = "base"
+
+
+def get_tariff(key: str) -> TariffSchedule:
+    return TARIFFS.get(key, TARIFFS[DEFAULT_TARIFF])
+
+
+class OrderLine(NamedTuple):
+    name: str
+    price: int
+    quantity: int
+    revision: int
+
+    @property
+    def amount(self) -> int:
+        return self.price * self.quantity
+
+    def __str__(self) -> str:
+        if self.quantity == 1:
+            return f"{self.name} - {format_money(self.price)}"
+        return f"{self.name} × {self.quantity} - {format_money(self.amount)}"
+
+
+class OrderBook:
+    """Заказ стола в компактном неизменяемом виде.
+
+    Одинаковые позиции (название и цена) сливаются в одну строку с
+    количеством. add() и clear() возвращают новый заказ, поэтому снимок
+    можно отдать отрисовке без копирования. Каждая строка помнит ревизию
+    своего последнего изменения, а generation меняется при очистке, поэтому
+    отрисовка может обновлять только добавленные и изменённые строки.
+    """
+
+    __slots__ = ("lines", "_index", "total", "revision", "generation")
+
+    def __init__(self, lines: Tuple[OrderLine, ...] = (), total: int = 0,
+                 revision: int = 0, generation: int = 0, index: Optional[dict] = None):
+        self.lines = lines
+        self._index = index if index is not None else {(line.name, line.price): i for i, line in enumerate(lines)}
+        self.total = total
+        self.revision = revision
+        self.generation = generation
+
+    def add(self, name: str, price: int, quantity: int = 1) -> "OrderBook":
+        revision = self.revision + 1
+        i = self._index.get((name, price))
+        if i is None:
+            lines = self.lines + (OrderLine(name, price, quantity, revision),)
+            index = {**self._index, (name, price): len(self.lines)}
+        else:
+            line = self.lines[i]
+            lines = self.lines[:i] + (line._replace(quantity=line.quantity + quantity, revision=revision),) + self.lines[i + 1:]
+            index = self._index
+        return OrderBook(lines, self.total + price * quantity, revision, self.generation, index)
+
+    def clear(self) -> "OrderBook":
+        return OrderBook((), 0, self.revision + 1, self.generation + 1)
+
+    @property
+    def item_count(self) -> int:
+        return sum(line.quantity for line in self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+EMPTY_ORDER = OrderBook()
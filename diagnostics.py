@@ -0,0 +1,161 @@
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Корзины гистограммы: степени двойки в микросекундах, от 1 мкс до ~17 минут
+BUCKETS = 30
+
+
+class Histogram:
+    """Гистограмма значений с логарифмическими корзинами.
+
+    Запись - O(1) без хранения отдельных замеров, перцентили приблизительные
+    (верхняя граница корзины), чего достаточно, чтобы найти тормозящий обработчик.
+    """
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def record(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.buckets[min(BUCKETS - 1, max(0, int(value)).bit_length())] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(float(1 << i), self.max)
+        return self.max
+
+
+class Profiler:
+    """Сбор времени обработчиков и числа обновлений UI.
+
+    Для каждого события считается время выполнения и сколько контролов оно
+    пометило изменёнными; для батчера - число вызовов page.update() и
+    контролов в каждом из них. Данные показываются в панели диагностики и
+    могут быть выгружены в лог.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}
+            self.touched = {}
+            self.flush_sizes = Histogram()
+            self.update_calls = 0
+            self.started_at = time.time()
+
+    @contextmanager
+    def measure(self, name: str):
+        # Вложенные обработчики (update_table_info внутри select_table) учитываются и отдельно
+        outer = getattr(self._local, "marks", None)
+        self._local.marks = 0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_us = (time.perf_counter() - started) * 1_000_000
+            marks = self._local.marks
+            self._local.marks = outer + marks if outer is not None else None
+            with self._lock:
+                self.timings.setdefault(name, Histogram()).record(elapsed_us)
+                self.touched.setdefault(name, Histogram()).record(marks)
+
+    def instrument(self, name: str):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.measure(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count_marks(self, n: int):
+        if getattr(self._local, "marks", None) is not None:
+            self._local.marks += n
+
+    def record_flush(self, controls: int):
+        with self._lock:
+            self.update_calls += 1
+            self.flush_sizes.record(controls)
+
+    def rows(self) -> list:
+        """Строки для отображения: самые дорогие по суммарному времени обработчики сверху."""
+        with self._lock:
+            rows = [
+                {
+                    "name": name,
+                    "count": h.count,
+                    "mean_ms": h.mean / 1000,
+                    "p50_ms": h.percentile(50) / 1000,
+                    "p95_ms": h.percentile(95) / 1000,
+                    "max_ms": h.max / 1000,
+                    "total_ms": h.total / 1000,
+                    "touched": self.touched[name].mean,
+                }
+                for name, h in self.timings.items()
+            ]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+
+    def dump(self, logger: logging.Logger = logging.getLogger()):
+        uptime = time.time() - self.started_at
+        logger.info(
+            f"Diagnostics over {uptime:.0f}s: {self.update_calls} page updates, "
+            f"{self.flush_sizes.mean:.1f} controls per update (max {self.flush_sizes.max:.0f})"
+        )
+        for row in self.rows():
+            logger.info(
+                f"  {row['name']}: n={row['count']} mean={row['mean_ms']:.2f}ms "
+                f"p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms max={row['max_ms']:.2f}ms "
+                f"touched={row['touched']:.1f}"
+            )
+
+
+class StartupTimer:
+    """Этапы холодного старта сессии.
+
+    mark() отмечает конец этапа: запоминается его длительность и время от
+    начала старта, так видно и время до первого кадра, и что его задерживает.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage: str):
+        at_ms = (time.perf_counter() - self.started) * 1000
+        previous = self.stages[-1]["at_ms"] if self.stages else 0.0
+        self.stages.append({"stage": stage, "ms": at_ms - previous, "at_ms": at_ms})
+
+    def summary(self) -> str:
+        return ", ".join(f"{s['stage']} {s['at_ms']:.0f}ms (+{s['ms']:.0f})" for s in self.stages)
+
+    def dump(self, logger: logging.Logger = logging.getLogger()):
+        logger.info(f"Startup: {self.summary()}")
+
+
+PROFILER = Profiler()
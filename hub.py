@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from billing import DEFAULT_TARIFF, TARIFFS, to_kopecks
+from journal import sidecar_path
+from ledger import Ledger
+from reports import ReportService
+from state import ClubState, TableState, TableStatus
+from storage import Storage
+
+# Сколько ждать переподключения клиента, прежде чем выселить его сессию
+IDLE_GRACE = 120.0
+
+
+class ClubHub:
+    """Клуб, общий для всех сессий процесса.
+
+    Одно состояние (ClubState), один цикл тиков и реестр сессий. Сессия -
+    это BilliardApp на своей странице: она получает дельты состояния через
+    receive_deltas() и регистрирует свои задачи тиков. Отключившийся клиент
+    не получает ни дельт, ни тиков; если он не вернулся за idle_grace секунд,
+    сессия выселяется, а при возврате догоняет состояние через resync().
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, storage: Storage, interval: float = 1.0, idle_grace: float = IDLE_GRACE,
+                 ledger: Optional[Ledger] = None):
+        self.storage = storage
+        # Журнал оплат лежит рядом с базой этого хранилища
+        self.ledger = ledger or Ledger(sidecar_path(storage.path, ".ledger"))
+        self.state = ClubState(storage, self.ledger)
+        self.reports = ReportService(self.ledger, storage)
+        self.interval = interval
+        self.idle_grace = idle_grace
+        self.catalog = None
+        self.tick_count = 0
+        self._tables_loaded = False
+        # Сессия -> момент отключения клиента (None - подключён)
+        self._sessions = {}
+        self._tickers = {}
+        self._running = False
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.state.subscribe(self._broadcast)
+
+    @classmethod
+    def shared(cls) -> "ClubHub":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(Storage.shared())
+            return cls._shared
+
+    # Загрузка при первой сессии
+
+    def load_catalog(self, products: list) -> list:
+        """Каталог загружается один раз; все сессии получают одни и те же позиции склада.
+
+        Цены каталога задаются в рублях, склад и база хранят их в копейках.
+        """
+        with self._lock:
+            if self.catalog is None:
+                saved = self.storage.load()["inventory"]
+                for product in products:
+                    if product["name"] in saved:
+                        product["stock"] = saved[product["name"]]["stock"]
+                        product["price"] = saved[product["name"]]["price"]
+                    else:
+                        product["price"] = to_kopecks(product["price"])
+                        self.storage.save_product(product)
+                # Дальше остатки живут только на складе ClubState
+                self.state.load_inventory(products)
+                self.catalog = list(self.state.inventory)
+            return self.catalog
+
+    def load_tables(self, count: int):
+        with self._lock:
+            if self._tables_loaded:
+                return
+            # Незакрытые аренды переживают перезапуск: сначала пробуем восстановить состояние
+            saved = self.storage.load()
+            if not self._restore_tables(saved):
+                self._seed_tables(count)
+            self.state.load_reservations(saved["reservations"])
+            self._tables_loaded = True
+
+    def _restore_tables(self, saved: dict) -> bool:
+        if not saved["tables"]:
+            return False
+
+        tables = []
+        for number, status, client_name, tariff in saved["tables"]:
+            table = TableState(
+                number=number,
+                status=TableStatus[status],
+                client_name=client_name,
+                tariff_key=tariff if tariff in TARIFFS else DEFAULT_TARIFF,
+            )
+            session = saved["sessions"].get(number)
+            if session is not None:
+                order = table.order
+                for product in session["products"]:
+                    order = order.add(product["name"], product["price"])
+                table = table._replace(session_id=session["id"], start_time=session["started_at"], order=order)
+            tables.append(table)
+
+        self.state.add_tables(tables, persist=False)
+        logging.info(f"Restored {len(tables)} tables and {len(saved['sessions'])} running sessions")
+        return True
+
+    def _seed_tables(self, count: int):
+        tables = []
+        for i in range(1, count + 1):
+            table = TableState(number=i)
+            if i % 3 == 0:
+                table = table._replace(
+                    status=TableStatus.OCCUPIED,
+                    start_time=datetime.datetime.now() - datetime.timedelta(minutes=random.randint(5, 120)),
+                )
+            tables.append(table)
+        # Сессии занятым столам открывает и сохраняет состояние
+        self.state.add_tables(tables)
+
+    # Сессии
+
+    def attach(self, session):
+        with self._lock:
+            self._sessions[session] = None
+            start = not self._running
+            if start:
+                self._running = True
+                self._generation += 1
+                generation = self._generation
+        if start:
+            # Цикл живёт в общем event loop Flet, страница нужна только чтобы в него попасть
+            session.page.run_task(self._run, generation)
+
+    def detach(self, session):
+        session.scheduler.stop()
+        with self._lock:
+            self._sessions.pop(session, None)
+            if not self._sessions:
+                self._running = False
+
+    def disconnected(self, session):
+        with self._lock:
+            if session not in self._sessions:
+                return
+            self._sessions[session] = time.monotonic()
+        session.scheduler.stop()
+
+    def connected(self, session):
+        with self._lock:
+            known = session in self._sessions
+            if known:
+                self._sessions[session] = None
+        if not known:
+            # Сессию уже выселили: подключаем заново
+            self.attach(session)
+        session.scheduler.start()
+        session.resync()
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    def _broadcast(self, deltas):
+        # Вызывается в потоке состояния: только раздаём дельты, отрисовка - в сессиях
+        for session, disconnected_at in list(self._sessions.items()):
+            if disconnected_at is None:
+                session.receive_deltas(deltas)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for session, disconnected_at in list(self._sessions.items()):
+            if disconnected_at is not None and now - disconnected_at > self.idle_grace:
+                logging.info(f"Evicting session idle for {now - disconnected_at:.0f}s")
+                self.detach(session)
+
+    # Общий цикл тиков
+
+    def add_ticker(self, ticker):
+        # Копирование при записи: цикл тиков перебирает словарь без блокировки
+        self._tickers = {**self._tickers, ticker: None}
+
+    def remove_ticker(self, ticker):
+        self._tickers = {t: None for t in self._tickers if t is not ticker}
+
+    async def _run(self, generation: int):
+        next_tick = time.monotonic() + self.interval
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            if not self._running or generation != self._generation:
+                break
+            self.tick_count += 1
+            now = datetime.datetime.now()
+            self.state.apply_reservations(now)
+            for ticker in self._tickers:
+                ticker.tick(self.tick_count, now)
+            self._evict_idle()
+
+            next_tick += self.interval
+            # Если цикл отстал (сон ноутбука, долгий обработчик) - не догоняем пропущенные тики
+            if next_tick < time.monotonic():
+                next_tick = time.monotonic() + self.interval
@@ -0,0 +1,121 @@
+import heapq
+from typing import Iterable, List, Optional
+
+# Порог "заканчивается" для товаров, у которых он не задан в каталоге
+DEFAULT_LOW_STOCK = 5
+
+
+class OutOfStock(ValueError):
+    pass
+
+
+class StockItem:
+    __slots__ = ("name", "price", "category", "stock", "threshold", "seq")
+
+    # Цена - в копейках, как и все суммы клуба
+
+    def __init__(self, name: str, price: int, category: str, stock: int, threshold: int = DEFAULT_LOW_STOCK):
+        self.name = name
+        self.price = price
+        self.category = category
+        self.stock = stock
+        self.threshold = threshold
+        # Номер последнего изменения: записи кучи со старым номером устарели
+        self.seq = 0
+
+    @property
+    def low(self) -> bool:
+        return self.stock <= self.threshold
+
+    def as_product(self) -> dict:
+        return {"name": self.name, "price": self.price, "stock": self.stock, "category": self.category}
+
+
+class Inventory:
+    """Склад бара: единственное место, где хранятся остатки.
+
+    Товары ищутся по SKU (названию) в словаре за O(1). Изменения выполняет
+    только поток состояния клуба (ClubState), поэтому проверка остатка и
+    списание в take() атомарны; читать stock() можно из любого потока.
+
+    Запас до порога (stock - threshold) каждого изменённого товара кладётся
+    в кучу. Пересечение порога определяется в момент изменения, а список
+    заканчивающихся товаров обходит только ту часть кучи, где запас <= 0,
+    не пересчитывая весь склад. Устаревшие записи отбрасываются лениво.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._heap = []
+
+    def load(self, products: Iterable[dict]):
+        self._index = {}
+        self._heap = []
+        for product in products:
+            item = StockItem(
+                product["name"],
+                product["price"],
+                product["category"],
+                product["stock"],
+                product.get("low_stock", DEFAULT_LOW_STOCK),
+            )
+            self._index[item.name] = item
+            self._heap.append((item.stock - item.threshold, item.seq, item.name))
+        heapq.heapify(self._heap)
+
+    def get(self, sku: str) -> Optional[StockItem]:
+        return self._index.get(sku)
+
+    def stock(self, sku: str) -> int:
+        item = self._index.get(sku)
+        return item.stock if item is not None else 0
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+    def __len__(self):
+        return len(self._index)
+
+    def take(self, sku: str, quantity: int = 1) -> bool:
+        """Списывает товар, если его хватает; возвращает True, если остаток только что опустился до порога."""
+        item = self._index.get(sku)
+        if item is None:
+            raise OutOfStock(f"Товар {sku} не найден")
+        if item.stock < quantity:
+            raise OutOfStock(f"{sku}: осталось {item.stock} шт.")
+        was_low = item.low
+        self._set(item, item.stock - quantity)
+        return item.low and not was_low
+
+    def put_back(self, sku: str, quantity: int = 1):
+        """Возврат на склад, например при очистке неоплаченного заказа."""
+        item = self._index.get(sku)
+        if item is not None and quantity > 0:
+            self._set(item, item.stock + quantity)
+
+    def _set(self, item: StockItem, stock: int):
+        item.stock = stock
+        item.seq += 1
+        heapq.heappush(self._heap, (stock - item.threshold, item.seq, item.name))
+        # Устаревшие записи копятся; когда их больше, чем живых, кучу пересобираем
+        if len(self._heap) > 2 * len(self._index) + 64:
+            self._heap = [(i.stock - i.threshold, i.seq, i.name) for i in self._index.values()]
+            heapq.heapify(self._heap)
+
+    def low_stock(self) -> List[StockItem]:
+        """Товары на пороге и ниже, самые дефицитные первыми."""
+        heap = self._heap
+        found = []
+        # Потомки в куче не меньше родителя: поддеревья с запасом > 0 не обходим
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            headroom, seq, sku = heap[i]
+            if headroom > 0:
+                continue
+            item = self._index.get(sku)
+            if item is not None and item.seq == seq:
+                found.append(item)
+            stack.extend(child for child in (2 * i + 1, 2 * i + 2) if child < len(heap))
+        found.sort(key=lambda item: item.stock - item.threshold)
+        return found
@@ -0,0 +1,167 @@
+"""Журнал операций хранилища: страховка отложенной записи от падения процесса.
+
+    python journal.py billiard_club.journal
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import List, Tuple
+
+# Заголовок записи: длина данных, crc32 номера и данных, номер записи
+RECORD_HEADER = struct.Struct("<IIQ")
+SEQ = struct.Struct("<Q")
+
+
+def sidecar_path(db_path: str, suffix: str) -> str:
+    """Файл рядом с базой: sidecar_path("billiard_club.db", ".journal") -> billiard_club.journal."""
+    return os.path.splitext(db_path)[0] + suffix
+
+
+def read_records(data: bytes, committed: int = 0) -> Tuple[List[Tuple[int, list]], int, int]:
+    """Разбор журнала без записи на диск: (записи после committed, последний номер, длина целой части)."""
+    pending = []
+    last = committed
+    valid = 0
+    while valid + RECORD_HEADER.size <= len(data):
+        length, crc, seq = RECORD_HEADER.unpack_from(data, valid)
+        body = data[valid + RECORD_HEADER.size:valid + RECORD_HEADER.size + length]
+        if len(body) < length or zlib.crc32(body, zlib.crc32(SEQ.pack(seq))) != crc:
+            break
+        if seq > committed:
+            # Разбираются только неприменённые записи, остальные лишь пропускаются
+            pending.append((seq, json.loads(body)))
+        last = max(last, seq)
+        valid += RECORD_HEADER.size + length
+    return pending, last, valid
+
+
+class Journal:
+    """Журнал предзаписи для очереди Storage.
+
+    Каждая операция (или транзакция из нескольких) сначала дописывается сюда
+    с возрастающим номером и сразу уходит в кэш ОС - падение процесса её уже
+    не теряет. fsync делает фоновый поток не чаще раза в sync_interval, так
+    что на отключение питания рискуют только последние миллисекунды, а
+    команда не ждёт диска.
+
+    Снимком служит сама база: писатель Storage фиксирует номер последней
+    применённой записи в той же транзакции, что и операции. При старте
+    повторяются только записи после этого номера - хвост за последние
+    полсекунды, сколько бы ни длилась смена. Когда база догнала журнал, а он
+    вырос больше max_bytes, журнал обнуляется. Оборванная при сбое последняя
+    запись отрезается при открытии.
+    """
+
+    def __init__(self, path: str, sync_interval: float = 0.05, max_bytes: int = 1 << 20):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.max_bytes = max_bytes
+        self.seq = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+        self._file = open(path, "ab")
+        self._syncer = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+        self._syncer.start()
+        atexit.register(self.close)
+
+    # Восстановление
+
+    def recover(self, committed: int) -> List[Tuple[int, list]]:
+        """Записи с номером больше committed; нумерация продолжается с последней записи журнала."""
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pending, last, valid = read_records(data, committed)
+        with self._lock:
+            if valid < len(data):
+                logging.warning(f"{self.path}: dropping {len(data) - valid} bytes of a torn journal tail")
+                self._file.truncate(valid)
+            self._size = valid
+            self.seq = last
+        return pending
+
+    # Запись
+
+    def append(self, operations: list) -> int:
+        body = json.dumps(operations, ensure_ascii=False, separators=(",", ":")).encode()
+        with self._lock:
+            self.seq += 1
+            crc = zlib.crc32(body, zlib.crc32(SEQ.pack(self.seq)))
+            self._file.write(RECORD_HEADER.pack(len(body), crc, self.seq) + body)
+            self._file.flush()
+            self._size += RECORD_HEADER.size + len(body)
+            seq = self.seq
+        self._dirty.set()
+        return seq
+
+    def _sync_loop(self):
+        while True:
+            self._dirty.wait()
+            if self._closed:
+                break
+            # Пачка: все записи, пришедшие за интервал, закрываются одним fsync
+            time.sleep(self.sync_interval)
+            self._dirty.clear()
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def wants_compaction(self, committed: int) -> bool:
+        return committed >= self.seq and self._size > self.max_bytes
+
+    def compact(self, committed: int, force: bool = False) -> bool:
+        """Обнуляет журнал, если база применила все его записи; вызывать после того, как база на диске."""
+        with self._lock:
+            if committed < self.seq or self._file.closed or not (force or self._size > self.max_bytes):
+                return False
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self._size = 0
+        return True
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        self._closed = True
+        self._dirty.set()
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Содержимое журнала операций хранилища")
+    parser.add_argument("path", nargs="?", default=sidecar_path("billiard_club.db", ".journal"))
+    parser.add_argument("--after", type=int, default=0, help="показать записи после этого номера")
+    args = parser.parse_args()
+
+    # Только чтение: журнал работающего приложения не создаётся и не обрезается
+    if not os.path.exists(args.path):
+        parser.exit(1, f"Журнал не найден: {args.path}\n")
+    with open(args.path, "rb") as f:
+        data = f.read()
+    pending, last, valid = read_records(data, args.after)
+    for seq, operations in pending:
+        for operation, params in operations:
+            print(f"{seq:>8} {operation:<20} {params}")
+    print(f"Последняя запись: {last}, размер: {valid} байт")
+    if valid < len(data):
+        print(f"Оборванный хвост: {len(data) - valid} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Журнал оплат клуба и Z-отчёты по нему.
+
+    python ledger.py 2026-10-17 --path billiard_club.ledger
+"""
+
+import argparse
+import atexit
+import datetime
+import os
+import struct
+import threading
+from typing import Optional
+
+import numpy as np
+
+from journal import sidecar_path
+
+MAGIC = b"BLDG"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+
+# Одна закрытая сессия. Время - секунды от 1970-01-01 по местным часам клуба
+# (как datetime.now() без зоны), суммы - в копейках
+RECORD = np.dtype([
+    ("session", "<i8"),
+    ("table", "<u4"),
+    ("lines", "<u4"),
+    ("start", "<i8"),
+    ("end", "<i8"),
+    ("time_cost", "<i8"),
+    ("products_cost", "<i8"),
+])
+RECORD_STRUCT = struct.Struct("<qIIqqqq")
+assert RECORD_STRUCT.size == RECORD.itemsize
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DAY = 86400
+
+# Смены кассы: час начала и название. Сессия относится к смене, в которую её оплатили
+SHIFTS = ((0, "Ночь"), (8, "День"), (16, "Вечер"))
+
+
+def to_seconds(moment: datetime.datetime) -> int:
+    return (moment - EPOCH) // datetime.timedelta(seconds=1)
+
+
+def day_start(day: datetime.date) -> int:
+    return (day - EPOCH.date()).days * DAY
+
+
+def check_header(path: str, header: bytes):
+    if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION, RECORD.itemsize):
+        raise ValueError(f"{path}: неизвестный формат журнала")
+
+
+def read_records(path: str) -> np.ndarray:
+    """Записи журнала без открытия на запись; оборванная последняя запись не читается."""
+    with open(path, "rb") as f:
+        check_header(path, f.read(HEADER.size))
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", offset=HEADER.size, shape=(count,))
+
+
+class LedgerReader:
+    """Итоги по журналу оплат, открытому только на чтение: файл не создаётся и не обрезается."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def records(self) -> np.ndarray:
+        return read_records(self.path)
+
+    def between(self, first: datetime.date, last: datetime.date) -> np.ndarray:
+        """Сессии, оплаченные с first по last включительно."""
+        data = self.records()
+        end = data["end"]
+        return data[(end >= day_start(first)) & (end < day_start(last) + DAY)]
+
+    # Агрегаты
+
+    @staticmethod
+    def totals(data: np.ndarray) -> dict:
+        time_cost = int(data["time_cost"].sum())
+        products_cost = int(data["products_cost"].sum())
+        return {
+            "sessions": len(data),
+            "seconds": int((data["end"] - data["start"]).sum()),
+            "lines": int(data["lines"].sum()),
+            "time_cost": time_cost,
+            "products_cost": products_cost,
+            "total": time_cost + products_cost,
+        }
+
+    @staticmethod
+    def _grouped(data: np.ndarray, groups: np.ndarray, size: int) -> list:
+        # Одна проходка bincount на поле вместо цикла по записям
+        def column(values):
+            return np.bincount(groups, weights=values, minlength=size).astype(np.int64)
+
+        sessions = np.bincount(groups, minlength=size)
+        seconds = column(data["end"] - data["start"])
+        lines = column(data["lines"])
+        time_cost = column(data["time_cost"])
+        products_cost = column(data["products_cost"])
+        return [
+            {
+                "sessions": int(sessions[i]),
+                "seconds": int(seconds[i]),
+                "lines": int(lines[i]),
+                "time_cost": int(time_cost[i]),
+                "products_cost": int(products_cost[i]),
+                "total": int(time_cost[i] + products_cost[i]),
+            }
+            for i in range(size)
+        ]
+
+    def daily(self, first: datetime.date, last: datetime.date) -> list:
+        """Итоги по дням с first по last, включая дни без выручки."""
+        data = self.between(first, last)
+        days = (last - first).days + 1
+        groups = (data["end"] - day_start(first)) // DAY
+        rows = self._grouped(data, groups, days)
+        for i, row in enumerate(rows):
+            row["date"] = first + datetime.timedelta(days=i)
+        return rows
+
+    def by_shift(self, first: datetime.date, last: datetime.date) -> list:
+        data = self.between(first, last)
+        hours = (data["end"] % DAY) // 3600
+        groups = np.searchsorted([hour for hour, _ in SHIFTS], hours, side="right") - 1
+        rows = self._grouped(data, groups, len(SHIFTS))
+        for (hour, name), row in zip(SHIFTS, rows):
+            row["shift"] = name
+            row["from_hour"] = hour
+        return rows
+
+    def by_table(self, first: datetime.date, last: datetime.date) -> list:
+        data = self.between(first, last)
+        tables, groups = np.unique(data["table"], return_inverse=True)
+        rows = self._grouped(data, groups.ravel(), len(tables))
+        for table, row in zip(tables, rows):
+            row["table"] = int(table)
+        return rows
+
+    def z_report(self, day: Optional[datetime.date] = None) -> dict:
+        """Z-отчёт за день: итоги, разбивка по сменам и по столам."""
+        day = day or datetime.date.today()
+        return {
+            "date": day,
+            **self.totals(self.between(day, day)),
+            "shifts": self.by_shift(day, day),
+            "tables": self.by_table(day, day),
+        }
+
+
+class Ledger(LedgerReader):
+    """Журнал закрытых сессий только на дописывание.
+
+    Записи фиксированной длины (RECORD) идут подряд за 16-байтовым
+    заголовком, поэтому добавление - одна запись в конец файла, а чтение -
+    отображение файла в память (np.memmap) без разбора. Суточные, сменные и
+    постольные итоги считаются векторно через bincount и не зависят от
+    Python-цикла по записям. Оборванная при сбое последняя запись
+    отрезается при открытии.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+            self._file.flush()
+            size = HEADER.size
+        else:
+            with open(path, "rb") as f:
+                check_header(path, f.read(HEADER.size))
+        tail = (size - HEADER.size) % RECORD.itemsize
+        if tail:
+            size -= tail
+            self._file.truncate(size)
+        self._count = (size - HEADER.size) // RECORD.itemsize
+        self._view = None
+        atexit.register(self.close)
+
+    def __len__(self):
+        return self._count
+
+    def append(
+        self,
+        session_id: int,
+        table: int,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        time_cost: int,
+        products_cost: int,
+        lines: int,
+    ):
+        record = RECORD_STRUCT.pack(
+            session_id, table, lines, to_seconds(start), to_seconds(end), time_cost, products_cost
+        )
+        with self._lock:
+            self._file.write(record)
+            # Без fsync: запись уходит в кэш ОС и сразу видна через memmap
+            self._file.flush()
+            self._count += 1
+
+    def records(self) -> np.ndarray:
+        """Все записи журнала; отображение пересоздаётся, только если журнал вырос."""
+        with self._lock:
+            count = self._count
+            if self._view is None or len(self._view) != count:
+                if count == 0:
+                    self._view = np.empty(0, dtype=RECORD)
+                else:
+                    self._view = np.memmap(self.path, dtype=RECORD, mode="r", offset=HEADER.size, shape=(count,))
+            return self._view
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def main():
+    from billing import format_money
+
+    parser = argparse.ArgumentParser(description="Z-отчёт по журналу оплат")
+    parser.add_argument("date", nargs="?", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--path", default=sidecar_path("billiard_club.db", ".ledger"))
+    args = parser.parse_args()
+
+    # Только чтение: журнал работающего клуба не создаётся и не обрезается
+    if not os.path.exists(args.path):
+        parser.exit(1, f"Журнал не найден: {args.path}\n")
+    try:
+        report = LedgerReader(args.path).z_report(args.date)
+    except ValueError as error:
+        parser.exit(1, f"{error}\n")
+    print(f"Z-отчёт за {report['date']:%d.%m.%Y}")
+    print(f"Сессий: {report['sessions']}, позиций: {report['lines']}")
+    print(f"Время: {format_money(report['time_cost'])}, бар: {format_money(report['products_cost'])}")
+    print(f"Итого: {format_money(report['total'])}")
+    for row in report["shifts"]:
+        print(f"  {row['shift']:<6} {row['sessions']:>4} {format_money(row['total']):>14}")
+    for row in report["tables"]:
+        print(f"  Стол {row['table']:<3} {row['sessions']:>4} {format_money(row['total']):>14}")
+
+
+if __name__ == "__main__":
+    main()
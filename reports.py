@@ -0,0 +1,153 @@
+import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from ledger import DAY, Ledger, day_start
+
+HOUR = 3600
+
+
+class ClubReport(NamedTuple):
+    first: datetime.date
+    last: datetime.date
+    sessions: int
+    avg_seconds: float
+    time_cost: int
+    products_cost: int
+    # Номера столов и доля занятости каждого по часам суток: (столов, 24)
+    tables: np.ndarray
+    heatmap: np.ndarray
+    table_rows: list
+    products: list
+
+    @property
+    def total(self) -> int:
+        return self.time_cost + self.products_cost
+
+
+def occupancy(data: np.ndarray, first: datetime.date, days: int, tables: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Доля занятости столов по часам суток за days дней начиная с first.
+
+    Сессия обрезается по диапазону и раскладывается по часовой сетке: неполные
+    первый и последний часы добавляются точечно, полные часы между ними -
+    разностным массивом с накопленной суммой. Затем сетка складывается по
+    дням в 24 часа суток.
+    """
+    lo = day_start(first)
+    hours = days * 24
+    start = np.clip(data["start"], lo, lo + days * DAY) - lo
+    end = np.clip(data["end"], lo, lo + days * DAY) - lo
+    keep = end > start
+    start, end, groups = start[keep], end[keep], groups[keep]
+
+    first_hour = start // HOUR
+    last_hour = np.minimum((end - 1) // HOUR, hours - 1)
+    spans = last_hour > first_hour
+
+    busy = np.zeros((len(tables), hours), dtype=np.int64)
+    np.add.at(busy, (groups, first_hour), np.minimum(end, (first_hour + 1) * HOUR) - start)
+    np.add.at(busy, (groups[spans], last_hour[spans]), end[spans] - last_hour[spans] * HOUR)
+
+    full = np.zeros((len(tables), hours + 1), dtype=np.int64)
+    np.add.at(full, (groups[spans], first_hour[spans] + 1), HOUR)
+    np.add.at(full, (groups[spans], last_hour[spans]), -HOUR)
+    busy += np.cumsum(full, axis=1)[:, :hours]
+
+    return busy.reshape(len(tables), days, 24).sum(axis=1) / (days * HOUR)
+
+
+def product_mix(names: list, prices: list) -> list:
+    """Продажи бара по товарам: количество, выручка и доля, самые доходные первыми."""
+    if not names:
+        return []
+    products, groups = np.unique(np.array(names), return_inverse=True)
+    quantity = np.bincount(groups, minlength=len(products))
+    revenue = np.bincount(groups, weights=np.array(prices, dtype=np.int64), minlength=len(products)).astype(np.int64)
+    share = revenue / max(int(revenue.sum()), 1)
+    order = np.argsort(-revenue, kind="stable")
+    return [
+        {"name": str(products[i]), "quantity": int(quantity[i]), "revenue": int(revenue[i]), "share": float(share[i])}
+        for i in order
+    ]
+
+
+def build_report(ledger: Ledger, storage, first: datetime.date, last: datetime.date) -> ClubReport:
+    data = ledger.between(first, last)
+    days = (last - first).days + 1
+    tables, groups = np.unique(data["table"], return_inverse=True)
+    groups = groups.ravel()
+
+    seconds = data["end"] - data["start"]
+    sessions = np.bincount(groups, minlength=len(tables))
+    time_cost = np.bincount(groups, weights=data["time_cost"], minlength=len(tables)).astype(np.int64)
+    products_cost = np.bincount(groups, weights=data["products_cost"], minlength=len(tables)).astype(np.int64)
+    table_seconds = np.bincount(groups, weights=seconds, minlength=len(tables))
+    table_rows = [
+        {
+            "table": int(tables[i]),
+            "sessions": int(sessions[i]),
+            "avg_seconds": float(table_seconds[i] / sessions[i]),
+            "time_cost": int(time_cost[i]),
+            "products_cost": int(products_cost[i]),
+            "total": int(time_cost[i] + products_cost[i]),
+        }
+        for i in np.argsort(-(time_cost + products_cost), kind="stable")
+    ]
+
+    # Журнал оплат пишется сразу, а строки заказов доходят до базы через очередь писателя:
+    # дожидаемся её, иначе закешированный отчёт остался бы без последних оплат в разбивке бара
+    storage.flush()
+    names, prices = storage.sold_lines(first, last)
+    return ClubReport(
+        first=first,
+        last=last,
+        sessions=len(data),
+        avg_seconds=float(seconds.mean()) if len(data) else 0.0,
+        time_cost=int(time_cost.sum()),
+        products_cost=int(products_cost.sum()),
+        tables=tables,
+        heatmap=occupancy(data, first, days, tables, groups),
+        table_rows=table_rows,
+        products=product_mix(names, prices),
+    )
+
+
+class ReportService:
+    """Отчёты, посчитанные в фоне и закешированные по диапазону дат.
+
+    request() сразу возвращает Future: расчёт идёт в отдельном потоке и не
+    держит ни UI, ни поток состояния. Готовый отчёт переиспользуется, пока
+    в журнале не появились новые оплаты; диапазоны, закончившиеся до
+    сегодняшнего дня, уже не меняются и не пересчитываются.
+    """
+
+    def __init__(self, ledger: Ledger, storage, cache_size: int = 16):
+        self.ledger = ledger
+        self.storage = storage
+        self.cache_size = cache_size
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reports")
+
+    def request(self, first: datetime.date, last: datetime.date) -> Future:
+        key = (first, last)
+        count = len(self.ledger)
+        with self._lock:
+            cached = self._cache.pop(key, None)
+            if cached is not None and not self._failed(cached[1]):
+                if cached[0] == count or last < datetime.date.today():
+                    self._cache[key] = cached
+                    return cached[1]
+            future = self._executor.submit(build_report, self.ledger, self.storage, first, last)
+            self._cache[key] = (count, future)
+            # Словарь упорядочен по последнему обращению: вытесняем самые старые диапазоны
+            while len(self._cache) > self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+        return future
+
+    @staticmethod
+    def _failed(future: Future) -> bool:
+        return future.done() and future.exception() is not None
@@ -0,0 +1,169 @@
+import bisect
+import datetime
+import heapq
+from typing import Iterable, List, NamedTuple, Optional
+
+# За сколько до начала брони стол перестаёт сдаваться и получает статус "Бронь"
+HOLD_BEFORE = datetime.timedelta(minutes=15)
+
+
+class ReservationConflict(ValueError):
+    pass
+
+
+class Reservation(NamedTuple):
+    id: int
+    table: int
+    start: datetime.datetime
+    end: datetime.datetime
+    customer: str = ""
+    phone: str = ""
+
+    def covers(self, now: datetime.datetime) -> bool:
+        """Бронь действует: от HOLD_BEFORE до начала и до конца."""
+        return self.start - HOLD_BEFORE <= now < self.end
+
+    def describe(self, today: Optional[datetime.date] = None) -> str:
+        day = "" if self.start.date() == (today or datetime.date.today()) else f"{self.start:%d.%m} "
+        who = f" {self.customer}" if self.customer else ""
+        return f"{day}{self.start:%H:%M}-{self.end:%H:%M}{who}"
+
+
+class _TableBookings:
+    """Брони одного стола: не пересекаются, поэтому отсортированы и по началу, и по концу."""
+
+    __slots__ = ("starts", "ends", "items")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.items = []
+
+    def conflict(self, start: datetime.datetime, end: datetime.datetime) -> Optional[Reservation]:
+        # Последняя бронь, начавшаяся до конца окна; раньше неё все закончились ещё раньше
+        i = bisect.bisect_left(self.starts, end)
+        if i and self.ends[i - 1] > start:
+            return self.items[i - 1]
+        return None
+
+    def insert(self, reservation: Reservation):
+        i = bisect.bisect_left(self.starts, reservation.start)
+        self.starts.insert(i, reservation.start)
+        self.ends.insert(i, reservation.end)
+        self.items.insert(i, reservation)
+
+    def remove(self, reservation: Reservation) -> bool:
+        i = bisect.bisect_left(self.starts, reservation.start)
+        if i < len(self.items) and self.items[i].id == reservation.id:
+            del self.starts[i], self.ends[i], self.items[i]
+            return True
+        return False
+
+    def upcoming(self, now: datetime.datetime) -> Optional[Reservation]:
+        i = bisect.bisect_right(self.ends, now)
+        return self.items[i] if i < len(self.items) else None
+
+    def prune(self, now: datetime.datetime) -> List[Reservation]:
+        i = bisect.bisect_right(self.ends, now)
+        ended = self.items[:i]
+        del self.starts[:i], self.ends[:i], self.items[:i]
+        return ended
+
+
+class ReservationBook:
+    """Брони клуба с отсортированным списком интервалов на каждый стол.
+
+    Проверка конфликта и поиск ближайшей брони стола - двоичный поиск,
+    O(log n); запрос свободных столов на окно - O(столов * log n). Моменты,
+    когда столу пора сменить статус (начало удержания и конец брони), лежат
+    в куче событий: тик смотрит только на её вершину. Отменённые брони
+    оставляют в куче устаревшие события, они безвредны - по событию стол
+    лишь сверяется с текущими бронями.
+
+    Меняет книгу только поток состояния клуба (ClubState).
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._by_id = {}
+        self._events = []
+
+    def load(self, reservations: Iterable[Reservation]):
+        self._tables = {}
+        self._by_id = {}
+        self._events = []
+        for reservation in sorted(reservations, key=lambda r: r.start):
+            self.add(reservation)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, reservation_id: int) -> Optional[Reservation]:
+        return self._by_id.get(reservation_id)
+
+    def for_table(self, number: int) -> List[Reservation]:
+        bookings = self._tables.get(number)
+        return list(bookings.items) if bookings is not None else []
+
+    def conflict(self, number: int, start: datetime.datetime, end: datetime.datetime) -> Optional[Reservation]:
+        bookings = self._tables.get(number)
+        return bookings.conflict(start, end) if bookings is not None else None
+
+    def check(self, number: int, start: datetime.datetime, end: datetime.datetime):
+        if end <= start:
+            raise ValueError("Конец брони должен быть позже начала")
+        clash = self.conflict(number, start, end)
+        if clash is not None:
+            raise ReservationConflict(f"Стол {number} уже забронирован: {clash.describe()}")
+
+    def add(self, reservation: Reservation):
+        self.check(reservation.table, reservation.start, reservation.end)
+        self._tables.setdefault(reservation.table, _TableBookings()).insert(reservation)
+        self._by_id[reservation.id] = reservation
+        heapq.heappush(self._events, (reservation.start - HOLD_BEFORE, reservation.table))
+        heapq.heappush(self._events, (reservation.end, reservation.table))
+
+    def remove(self, reservation_id: int) -> Optional[Reservation]:
+        reservation = self._by_id.pop(reservation_id, None)
+        if reservation is not None:
+            self._tables[reservation.table].remove(reservation)
+        return reservation
+
+    def remove_table(self, number: int) -> List[Reservation]:
+        bookings = self._tables.pop(number, None)
+        if bookings is None:
+            return []
+        for reservation in bookings.items:
+            del self._by_id[reservation.id]
+        return bookings.items
+
+    def upcoming(self, number: int, now: datetime.datetime) -> Optional[Reservation]:
+        """Ближайшая незакончившаяся бронь стола (в том числе идущая сейчас)."""
+        bookings = self._tables.get(number)
+        return bookings.upcoming(now) if bookings is not None else None
+
+    def free_tables(self, numbers: Iterable[int], start: datetime.datetime, end: datetime.datetime) -> List[int]:
+        return [number for number in numbers if self.conflict(number, start, end) is None]
+
+    @property
+    def next_event(self) -> Optional[datetime.datetime]:
+        # Читается потоком тиков без блокировки: вершина кучи всегда валидный кортеж
+        try:
+            return self._events[0][0]
+        except IndexError:
+            return None
+
+    def due(self, now: datetime.datetime) -> set:
+        """Столы, у которых наступило событие; закончившиеся брони этих столов удаляются."""
+        numbers = set()
+        while self._events and self._events[0][0] <= now:
+            numbers.add(heapq.heappop(self._events)[1])
+        for number in numbers:
+            bookings = self._tables.get(number)
+            if bookings is None:
+                continue
+            for reservation in bookings.prune(now):
+                del self._by_id[reservation.id]
+            if not bookings.items:
+                del self._tables[number]
+        return numbers
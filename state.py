@@ -0,0 +1,546 @@
+import contextlib
+import datetime
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from enum import Enum
+from typing import Iterable, NamedTuple, Optional
+
+from applog import log_event
+from billing import DEFAULT_TARIFF, EMPTY_ORDER, OrderBook, TariffSchedule, get_tariff
+from inventory import Inventory
+from reservations import Reservation, ReservationBook
+
+
+class TableStatus(Enum):
+    AVAILABLE = "Свободен"
+    OCCUPIED = "Занят"
+    MAINTENANCE = "Обслуживание"
+    RESERVED = "Бронь"
+
+
+class StaleReceipt(ValueError):
+    """Счёт стола изменился после того, как клиенту показали чек."""
+
+
+class TableState(NamedTuple):
+    """Неизменяемый снимок стола.
+
+    Изменения создают новый объект через _replace, поэтому отрисовка и тики
+    могут читать стол без блокировок: start_time и сессия не пропадут на
+    середине расчёта.
+    """
+
+    number: int
+    status: TableStatus = TableStatus.AVAILABLE
+    client_name: str = ""
+    start_time: Optional[datetime.datetime] = None
+    tariff_key: str = DEFAULT_TARIFF
+    session_id: Optional[int] = None
+    order: OrderBook = EMPTY_ORDER
+    # Ближайшая незакончившаяся бронь стола
+    reservation: Optional[Reservation] = None
+
+    @property
+    def tariff(self) -> TariffSchedule:
+        return get_tariff(self.tariff_key)
+
+    def time_cost(self, now: datetime.datetime) -> int:
+        if self.start_time is None:
+            return 0
+        return self.tariff.cost(self.start_time, now)
+
+    @property
+    def order_total(self) -> int:
+        return self.order.total
+
+    @property
+    def bill_key(self) -> tuple:
+        """Меняется вместе со счётом: другая сессия, новая позиция или очищенный заказ."""
+        return (self.session_id, self.order.generation, self.order.revision)
+
+
+class TableRegistry:
+    """Столы клуба с индексами по номеру и по статусу.
+
+    Реестр неизменяем: put/without возвращают новый реестр. Копируется
+    только словарь номеров и индексы затронутых статусов, остальные
+    разделяются со старым снимком. Поиск стола - O(1), выборка по статусу
+    стоит O(столов в этом статусе).
+    """
+
+    def __init__(self, by_number: Optional[dict] = None, by_status: Optional[dict] = None):
+        self._by_number = by_number if by_number is not None else {}
+        # Словари используются как упорядоченные множества: номер -> стол
+        self._by_status = by_status if by_status is not None else {status: {} for status in TableStatus}
+
+    def put(self, table: TableState) -> "TableRegistry":
+        by_number = dict(self._by_number)
+        by_status = dict(self._by_status)
+        old = by_number.get(table.number)
+        if old is not None and old.status != table.status:
+            by_status[old.status] = {n: t for n, t in by_status[old.status].items() if n != table.number}
+        by_number[table.number] = table
+        by_status[table.status] = {**by_status[table.status], table.number: table}
+        return TableRegistry(by_number, by_status)
+
+    def put_many(self, tables: Iterable[TableState]) -> "TableRegistry":
+        by_number = dict(self._by_number)
+        by_status = {status: dict(tables_) for status, tables_ in self._by_status.items()}
+        for table in tables:
+            old = by_number.get(table.number)
+            if old is not None:
+                del by_status[old.status][table.number]
+            by_number[table.number] = table
+            by_status[table.status][table.number] = table
+        return TableRegistry(by_number, by_status)
+
+    def without(self, number: int) -> "TableRegistry":
+        old = self._by_number.get(number)
+        if old is None:
+            return self
+        by_number = {n: t for n, t in self._by_number.items() if n != number}
+        by_status = dict(self._by_status)
+        by_status[old.status] = {n: t for n, t in by_status[old.status].items() if n != number}
+        return TableRegistry(by_number, by_status)
+
+    def get(self, number: Optional[int]) -> Optional[TableState]:
+        return self._by_number.get(number)
+
+    def with_status(self, status: TableStatus):
+        return self._by_status[status].values()
+
+    def numbers_with_status(self, status: TableStatus):
+        return sorted(self._by_status[status])
+
+    def __iter__(self):
+        return iter(self._by_number.values())
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def __contains__(self, table):
+        return self._by_number.get(table.number) is table
+
+
+class Delta(NamedTuple):
+    """Компактное уведомление подписчикам: что изменилось, а не новое значение.
+
+    kind - "table", "table_added", "table_removed" или "stock"; key - номер
+    стола или название товара. Актуальное значение берётся из снимка.
+    """
+
+    kind: str
+    key: object
+    version: int
+
+
+class ClubSnapshot(NamedTuple):
+    version: int
+    tables: TableRegistry
+    # Заканчивающиеся товары (название, остаток), самые дефицитные первыми
+    low_stock: tuple = ()
+
+
+class ClubState:
+    """Единственный писатель состояния клуба.
+
+    Любое изменение столов и склада - команда, которая выполняется в потоке
+    club-state строго по очереди; после неё публикуется новый неизменяемый
+    снимок. Обработчики UI и тики читают snapshot без блокировок, а запись
+    в Storage и журнал событий идёт в том же порядке, что и изменения.
+    Подписчики получают после каждой команды кортеж Delta. Остатки хранит
+    Inventory: менять его могут только команды, читать - кто угодно. Брони
+    хранит ReservationBook; по его событиям тик переводит столы в "Бронь"
+    и обратно. Оплаченные сессии дописываются в журнал оплат (Ledger), если он задан.
+    Пакетные команды (settle_many и др.) пишут в Storage одной транзакцией
+    и публикуют дельты один раз.
+    """
+
+    def __init__(self, storage, ledger=None):
+        self.storage = storage
+        self.ledger = ledger
+        self.snapshot = ClubSnapshot(0, TableRegistry())
+        self.inventory = Inventory()
+        self.reservations = ReservationBook()
+        self._listeners = []
+        # Изменения пакетной команды: публикуются одним кортежем дельт в конце
+        self._pending = None
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="club-state", daemon=True)
+        self._thread.start()
+
+    # Очередь команд
+
+    def submit(self, command, *args) -> Future:
+        future = Future()
+        self._queue.put((future, command, args))
+        return future
+
+    def call(self, command, *args):
+        # Команда, вызванная из другой команды, выполняется сразу, иначе поток ждал бы сам себя
+        if threading.current_thread() is self._thread:
+            return command(*args)
+        return self.submit(command, *args).result()
+
+    def _run(self):
+        while True:
+            future, command, args = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(command(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def subscribe(self, listener):
+        """Подписка на изменения; listener(deltas) вызывается в потоке состояния и должен быть быстрым."""
+        self._listeners = self._listeners + [listener]
+        return lambda: self.unsubscribe(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners = [l for l in self._listeners if l is not listener]
+
+    def _publish(self, tables: Optional[TableRegistry] = None, changes=()):
+        current = self.snapshot
+        version = current.version + 1
+        low_stock = current.low_stock
+        if any(kind == "stock" for kind, _ in changes):
+            low_stock = tuple((item.name, item.stock) for item in self.inventory.low_stock())
+        self.snapshot = ClubSnapshot(version, tables if tables is not None else current.tables, low_stock)
+        if self._pending is not None:
+            self._pending.extend(changes)
+            return
+        if not changes:
+            return
+        deltas = tuple(Delta(kind, key, version) for kind, key in changes)
+        for listener in self._listeners:
+            try:
+                listener(deltas)
+            except Exception as e:
+                logging.error(f"Error in state listener: {e}")
+
+    @contextlib.contextmanager
+    def _batched(self):
+        """Команда над многими столами: одна транзакция хранилища и одна пачка дельт.
+
+        Снимок обновляется после каждого стола, как обычно, а подписчики
+        узнают обо всех изменениях разом, когда команда закончилась.
+        """
+        if self._pending is not None:
+            yield
+            return
+        self._pending = []
+        try:
+            with self.storage.transaction():
+                yield
+        finally:
+            changes, self._pending = self._pending, None
+            self._publish(changes=list(dict.fromkeys(changes)))
+
+    def _table(self, number: int) -> TableState:
+        table = self.snapshot.tables.get(number)
+        if table is None:
+            raise ValueError(f"Стол {number} не найден")
+        return table
+
+    # Команды
+
+    def load_inventory(self, products: Iterable[dict]):
+        return self.call(self._load_inventory, list(products))
+
+    def _load_inventory(self, products):
+        self.inventory.load(products)
+        self._publish(changes=[("stock", product["name"]) for product in products])
+
+    def low_stock(self) -> tuple:
+        """Товары на пороге остатка и ниже как (название, остаток); читается из снимка без очереди команд."""
+        return self.snapshot.low_stock
+
+    def _return_order(self, table: TableState) -> list:
+        # Неоплаченный заказ возвращается на склад
+        for line in table.order:
+            self.inventory.put_back(line.name, line.quantity)
+            item = self.inventory.get(line.name)
+            if item is not None:
+                self.storage.save_product(item.as_product())
+        if len(table.order):
+            log_event("stock_return", table=table.number, session=table.session_id,
+                      items=table.order.item_count, amount=table.order_total)
+        return [("stock", line.name) for line in table.order]
+
+    def add_tables(self, tables: Iterable[TableState], persist: bool = True):
+        """Добавляет столы одним снимком; при persist занятым столам открываются сессии."""
+        return self.call(self._add_tables, list(tables), persist)
+
+    def _add_tables(self, tables, persist):
+        added = []
+        for table in tables:
+            if self.snapshot.tables.get(table.number) is not None:
+                raise ValueError(f"Стол {table.number} уже существует")
+            if persist:
+                if table.status == TableStatus.OCCUPIED and table.session_id is None:
+                    table = table._replace(session_id=self.storage.start_session(table))
+                self.storage.save_table(table)
+            added.append(table)
+        self._publish(tables=self.snapshot.tables.put_many(added),
+                      changes=[("table_added", table.number) for table in added])
+        return added
+
+    def set_status(self, number: int, status: TableStatus, now: Optional[datetime.datetime] = None) -> TableState:
+        return self.call(self._set_status, number, status, now or datetime.datetime.now())
+
+    def _set_status(self, number, status, now):
+        return self._release(self._change_status(self._table(number), status, now), now)
+
+    def _release(self, table: TableState, now: datetime.datetime) -> TableState:
+        # Событие удержания могло пройти, пока стол был занят: освободившийся стол сверяется с бронями
+        if table.status == TableStatus.AVAILABLE:
+            return self._reconcile(table, now)
+        return table
+
+    def _change_status(self, table, status, now, paid=False, client_name=""):
+        number = table.number
+        previous = table.status
+        if status == TableStatus.OCCUPIED and previous == TableStatus.OCCUPIED and table.session_id is not None:
+            # Повторное "Занят" не переоткрывает сессию: заказ остался бы за закрытой неоплаченной
+            return table
+        changes = [("table", number)]
+
+        if table.session_id is not None:
+            self.storage.end_session(table.session_id, now)
+            log_event("session_end", table=number, session=table.session_id, paid=False)
+            table = table._replace(session_id=None)
+
+        if status == TableStatus.OCCUPIED:
+            table = table._replace(status=status, start_time=now, client_name="Гость")
+            table = table._replace(session_id=self.storage.start_session(table))
+            log_event("session_start", table=number, session=table.session_id, tariff=table.tariff_key)
+        else:
+            # Без сессии заказ не живёт: неоплаченный возвращается на склад при любом статусе, и брони тоже
+            table = table._replace(status=status, start_time=None, client_name=client_name)
+            if not paid:
+                changes.extend(self._return_order(table))
+            table = table._replace(order=table.order.clear())
+
+        self.storage.save_table(table)
+        log_event("status_change", table=number, status=status.name, previous=previous.name)
+        self._publish(tables=self.snapshot.tables.put(table), changes=changes)
+        return table
+
+    def set_tariff(self, number: int, tariff_key: str) -> TableState:
+        return self.call(self._set_tariff, number, tariff_key)
+
+    def _set_tariff(self, number, tariff_key):
+        table = self._table(number)._replace(tariff_key=tariff_key)
+        self.storage.save_table(table)
+        self._publish(tables=self.snapshot.tables.put(table), changes=[("table", number)])
+        return table
+
+    def add_order_line(self, number: int, name: str, price: int) -> TableState:
+        """Добавляет позицию к заказу занятого стола, если товар есть на складе, и списывает его."""
+        return self.call(self._add_order_line, number, name, price)
+
+    def _add_order_line(self, number, name, price):
+        table = self._table(number)
+        if table.status != TableStatus.OCCUPIED:
+            raise ValueError(f"Стол {number} должен быть занят")
+        # Проверка и списание в одной команде: два терминала не продадут последнюю бутылку дважды
+        crossed = self.inventory.take(name)
+        item = self.inventory.get(name)
+        table = table._replace(order=table.order.add(name, price))
+
+        self.storage.add_order_line(table.session_id, name, price)
+        self.storage.save_product(item.as_product())
+        log_event("order", table=number, session=table.session_id, product=name,
+                  price=price, order_total=table.order_total, stock=item.stock)
+        if crossed:
+            log_event("low_stock", product=name, stock=item.stock, threshold=item.threshold)
+        self._publish(tables=self.snapshot.tables.put(table), changes=[("table", number), ("stock", name)])
+        return table
+
+    def settle(self, number: int, ended_at: datetime.datetime, bill_key: Optional[tuple] = None) -> TableState:
+        """Закрывает сессию оплатой на момент ended_at и освобождает стол.
+
+        bill_key - счёт, который видел клиент (TableState.bill_key); если с тех пор
+        заказ поменялся, например в другой сессии, оплата отклоняется StaleReceipt.
+        """
+        return self.call(self._settle, number, ended_at, bill_key)
+
+    def _settle(self, number, ended_at, bill_key=None):
+        table = self._table(number)
+        if table.status != TableStatus.OCCUPIED or table.session_id is None:
+            raise ValueError(f"Стол {number} не занят")
+        if bill_key is not None and table.bill_key != bill_key:
+            raise StaleReceipt(f"Счёт стола {number} изменился, проверьте чек")
+        time_cost = table.time_cost(ended_at)
+        total = time_cost + table.order_total
+        self.storage.end_session(table.session_id, ended_at, total)
+        if self.ledger is not None:
+            self.ledger.append(table.session_id, number, table.start_time, ended_at,
+                               time_cost, table.order_total, len(table.order))
+        log_event("payment", table=number, session=table.session_id,
+                  seconds=int((ended_at - table.start_time).total_seconds()),
+                  time_cost=time_cost, products_cost=table.order_total, total=total,
+                  lines=len(table.order), tariff=table.tariff_key)
+        freed = self._change_status(table._replace(session_id=None), TableStatus.AVAILABLE, ended_at, paid=True)
+        return self._release(freed, ended_at)
+
+    # Пакетные команды: столы, к которым действие неприменимо, пропускаются
+
+    def settle_many(self, numbers: Iterable[int], ended_at: datetime.datetime,
+                    bill_keys: Optional[dict] = None) -> list:
+        """Оплачивает все занятые столы из numbers на момент ended_at.
+
+        bill_keys - номер стола -> счёт из показанного чека; столы, чей счёт
+        с тех пор изменился, пропускаются. Возвращает столы в том виде, в
+        каком их оплатили, - по ним печатаются чеки.
+        """
+        return self.call(self._settle_many, list(numbers), ended_at, bill_keys or {})
+
+    def _settle_many(self, numbers, ended_at, bill_keys):
+        paid = []
+        with self._batched():
+            for number in numbers:
+                table = self.snapshot.tables.get(number)
+                if table is None or table.status != TableStatus.OCCUPIED or table.session_id is None:
+                    continue
+                if bill_keys.get(number, table.bill_key) == table.bill_key:
+                    self._settle(number, ended_at)
+                    paid.append(table)
+        log_event("bulk_settle", tables=len(paid),
+                  total=sum(table.time_cost(ended_at) + table.order_total for table in paid))
+        return paid
+
+    def set_status_many(self, numbers: Iterable[int], status: TableStatus,
+                        now: Optional[datetime.datetime] = None) -> list:
+        """Меняет статус столов из numbers; занятые не трогаются - их сначала нужно оплатить."""
+        return self.call(self._set_status_many, list(numbers), status, now or datetime.datetime.now())
+
+    def _set_status_many(self, numbers, status, now):
+        changed = []
+        with self._batched():
+            for number in numbers:
+                table = self.snapshot.tables.get(number)
+                if table is not None and table.status not in (status, TableStatus.OCCUPIED):
+                    changed.append(self._release(self._change_status(table, status, now), now))
+        log_event("bulk_status", status=status.name, tables=len(changed))
+        return changed
+
+    def remove_table(self, number: int) -> TableState:
+        return self.call(self._remove_table, number)
+
+    def _remove_table(self, number):
+        table = self._table(number)
+        if table.session_id is not None:
+            self.storage.end_session(table.session_id, datetime.datetime.now())
+        changes = self._return_order(table)
+        for reservation in self.reservations.remove_table(number):
+            self.storage.cancel_reservation(reservation.id)
+        self.storage.delete_table(number)
+        log_event("table_removed", table=number)
+        self._publish(tables=self.snapshot.tables.without(number), changes=[("table_removed", number), *changes])
+        return table
+
+    # Брони
+
+    def load_reservations(self, reservations: Iterable[dict]):
+        return self.call(self._load_reservations, list(reservations), datetime.datetime.now())
+
+    def _load_reservations(self, reservations, now):
+        self.reservations.load(Reservation(**reservation) for reservation in reservations)
+        # Брони, пришедшие на время простоя, применяются сразу, не дожидаясь их событий
+        for number in {reservation["table"] for reservation in reservations}:
+            if self.snapshot.tables.get(number) is not None:
+                self._reconcile(self._table(number), now)
+
+    def reserve(self, number: int, start: datetime.datetime, end: datetime.datetime,
+                customer: str = "", phone: str = "") -> Reservation:
+        """Бронирует стол на [start, end); пересечение с другой бронью - ReservationConflict."""
+        return self.call(self._reserve, number, start, end, customer, phone, datetime.datetime.now())
+
+    def _reserve(self, number, start, end, customer, phone, now):
+        table = self._table(number)
+        if end <= now:
+            raise ValueError("Бронь уже закончилась")
+        # Конфликт проверяется до выдачи id, чтобы в базу не попала отклонённая бронь
+        self.reservations.check(number, start, end)
+        reservation = Reservation(self.storage.add_reservation(number, start, end, customer, phone),
+                                  number, start, end, customer, phone)
+        self.reservations.add(reservation)
+        log_event("reservation", table=number, reservation=reservation.id,
+                  start=start.isoformat(timespec="minutes"), end=end.isoformat(timespec="minutes"))
+        self._reconcile(table, now)
+        return reservation
+
+    def cancel_reservation(self, reservation_id: int) -> Optional[Reservation]:
+        return self.call(self._cancel_reservation, reservation_id, datetime.datetime.now())
+
+    def _cancel_reservation(self, reservation_id, now):
+        reservation = self.reservations.remove(reservation_id)
+        if reservation is None:
+            return None
+        self.storage.cancel_reservation(reservation_id)
+        log_event("reservation_cancel", table=reservation.table, reservation=reservation_id)
+        table = self.snapshot.tables.get(reservation.table)
+        if table is not None:
+            self._reconcile(table, now)
+        return reservation
+
+    def cancel_reservations(self, numbers: Iterable[int]) -> list:
+        """Снимает все брони столов из numbers, и идущие, и будущие."""
+        return self.call(self._cancel_reservations, list(numbers), datetime.datetime.now())
+
+    def _cancel_reservations(self, numbers, now):
+        cancelled = []
+        with self._batched():
+            for number in numbers:
+                for reservation in self.reservations.for_table(number):
+                    cancelled.append(self._cancel_reservation(reservation.id, now))
+        log_event("bulk_reservation_cancel", tables=len({r.table for r in cancelled}), reservations=len(cancelled))
+        return cancelled
+
+    def free_tables(self, start: datetime.datetime, end: datetime.datetime) -> list:
+        """Номера столов без брони на [start, end); если окно уже началось - ещё и не занятые сейчас."""
+        return self.call(self._free_tables, start, end, datetime.datetime.now())
+
+    def _free_tables(self, start, end, now):
+        tables = self.snapshot.tables
+        numbers = sorted(table.number for table in tables)
+        if start <= now:
+            numbers = [n for n in numbers if tables.get(n).status in (TableStatus.AVAILABLE, TableStatus.RESERVED)]
+        return self.reservations.free_tables(numbers, start, end)
+
+    def apply_reservations(self, now: datetime.datetime):
+        """Вызывается тиком; команда ставится в очередь, только если наступило событие брони."""
+        next_event = self.reservations.next_event
+        if next_event is not None and next_event <= now:
+            self.submit(self._apply_reservations, now)
+
+    def _apply_reservations(self, now):
+        for number in sorted(self.reservations.due(now)):
+            table = self.snapshot.tables.get(number)
+            if table is not None:
+                self._reconcile(table, now)
+
+    def _reconcile(self, table: TableState, now: datetime.datetime):
+        # Статус трогаем, только если стол свободен под бронь или держался бронью, которая кончилась
+        number = table.number
+        upcoming = self.reservations.upcoming(number, now)
+        active = upcoming if upcoming is not None and upcoming.covers(now) else None
+        held = table.status == TableStatus.RESERVED and table.reservation is not None
+        updated = table._replace(reservation=upcoming)
+        if active is not None and table.status == TableStatus.AVAILABLE:
+            return self._change_status(updated, TableStatus.RESERVED, now, client_name=active.customer)
+        if active is None and held:
+            return self._change_status(updated, TableStatus.AVAILABLE, now)
+        if active is not None and table.status == TableStatus.RESERVED:
+            # Брони встык: стол остаётся забронированным уже за следующим клиентом
+            updated = updated._replace(client_name=active.customer)
+        if updated == table:
+            # Тот же объект, что в снимке: UI сравнивает столы по идентичности
+            return table
+        self.storage.save_table(updated)
+        self._publish(tables=self.snapshot.tables.put(updated), changes=[("table", number)])
+        return updated
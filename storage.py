@@ -0,0 +1,394 @@
+import atexit
+import contextlib
+import datetime
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from billing import KOPECKS_PER_RUBLE
+from journal import Journal, sidecar_path
+
+DB_PATH = "billiard_club.db"
+
+# Денежные суммы (total, price) хранятся в копейках
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tables (
+    number INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    client_name TEXT NOT NULL DEFAULT '',
+    tariff TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    table_number INTEGER NOT NULL,
+    client_name TEXT NOT NULL DEFAULT '',
+    started_at TEXT NOT NULL,
+    ended_at TEXT,
+    total INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions(table_number) WHERE ended_at IS NULL;
+CREATE TABLE IF NOT EXISTS order_lines (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    added_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS order_lines_session ON order_lines(session_id);
+CREATE TABLE IF NOT EXISTS inventory (
+    name TEXT PRIMARY KEY,
+    price INTEGER NOT NULL,
+    stock INTEGER NOT NULL,
+    category TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY,
+    table_number INTEGER NOT NULL,
+    customer TEXT NOT NULL DEFAULT '',
+    phone TEXT NOT NULL DEFAULT '',
+    starts_at TEXT NOT NULL,
+    ends_at TEXT NOT NULL,
+    cancelled_at TEXT
+);
+CREATE INDEX IF NOT EXISTS reservations_active ON reservations(ends_at) WHERE cancelled_at IS NULL;
+CREATE TABLE IF NOT EXISTS journal_checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL
+);
+"""
+
+# Денежные столбцы, которые в старых базах объявлены REAL и хранят рубли
+MONEY_COLUMNS = {"sessions": ("total",), "order_lines": ("price",), "inventory": ("price",)}
+
+# Операции записи по именам: в журнал уходит имя и параметры, а не текст SQL
+STATEMENTS = {
+    "save_table": "INSERT INTO tables (number, status, client_name, tariff) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT(number) DO UPDATE SET status=excluded.status, client_name=excluded.client_name, tariff=excluded.tariff",
+    "delete_table": "DELETE FROM tables WHERE number = ?",
+    "start_session": "INSERT INTO sessions (id, table_number, client_name, started_at) VALUES (?, ?, ?, ?)",
+    "end_session": "UPDATE sessions SET ended_at = ?, total = ? WHERE id = ?",
+    "add_order_line": "INSERT INTO order_lines (session_id, name, price, added_at) VALUES (?, ?, ?, ?)",
+    "add_reservation": "INSERT INTO reservations (id, table_number, customer, phone, starts_at, ends_at) VALUES (?, ?, ?, ?, ?, ?)",
+    "cancel_reservation": "UPDATE reservations SET cancelled_at = ? WHERE id = ?",
+    "save_product": "INSERT INTO inventory (name, price, stock, category) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET price=excluded.price, stock=excluded.stock, category=excluded.category",
+}
+CHECKPOINT = ("INSERT INTO journal_checkpoint (id, seq) VALUES (1, ?) "
+              "ON CONFLICT(id) DO UPDATE SET seq=excluded.seq WHERE excluded.seq > seq")
+
+
+class Storage:
+    """Хранилище клуба на SQLite (WAL) с отложенной записью.
+
+    Обработчики UI только кладут операции в очередь; отдельный поток-писатель
+    забирает их пачками и фиксирует одной транзакцией, поэтому клик никогда
+    не ждёт диска. Чтение выполняется один раз при старте через load().
+
+    Чтобы очередь не пропала вместе с процессом, операция сначала
+    дописывается в журнал (Journal) рядом с базой; при открытии хранилища
+    записи, не дошедшие до базы, применяются повторно.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str = DB_PATH, batch_size: int = 200, flush_interval: float = 0.5,
+                 journal: bool = True):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._closed = False
+        # Операции, собранные transaction() в текущем потоке
+        self._local = threading.local()
+        # Номер в журнале и место в очереди выдаются вместе, иначе писатель зафиксировал бы номера не по порядку
+        self._enqueue_lock = threading.Lock()
+        self.journal = Journal(sidecar_path(path, ".journal")) if journal else None
+        self.recovered = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        if self.journal is not None:
+            self._recover(conn)
+        self._next_session_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM sessions").fetchone()[0]
+        self._next_reservation_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM reservations").fetchone()[0]
+        conn.close()
+        self._id_lock = threading.Lock()
+
+        self._writer = threading.Thread(target=self._write_loop, name="storage-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def shared(cls) -> "Storage":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _recover(self, conn: sqlite3.Connection):
+        """Повторяет записи журнала, которые не успели попасть в базу до падения процесса."""
+        pending = self.journal.recover(self._checkpoint(conn))
+        if pending:
+            self._commit(conn, pending)
+            self.recovered = sum(len(operations) for _, operations in pending)
+            logging.warning(f"Replayed {self.recovered} storage operations from {self.journal.path}")
+        self._compact(conn, force=True)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Переводит рублёвые REAL-столбцы старых баз в целые копейки; таблицы пересоздаются по SCHEMA."""
+        legacy = [
+            table for table, columns in MONEY_COLUMNS.items()
+            if any(row[1] in columns and row[2].upper() == "REAL"
+                   for row in conn.execute(f"PRAGMA table_info({table})"))
+        ]
+        if not legacy:
+            return
+        statements = [statement for statement in SCHEMA.split(";") if statement.strip()]
+        with conn:
+            # Переименование и копирование - одна транзакция: при сбое остаётся старая база
+            conn.execute("BEGIN")
+            for table in legacy:
+                conn.execute(f"ALTER TABLE {table} RENAME TO {table}_rubles")
+            # Индексы остались у переименованных таблиц и создаются заново после их удаления
+            for statement in statements:
+                conn.execute(statement)
+            for table in legacy:
+                names = [row[1] for row in conn.execute(f"PRAGMA table_info({table}_rubles)")]
+                values = [
+                    f"CAST(ROUND({name} * {KOPECKS_PER_RUBLE}) AS INTEGER)" if name in MONEY_COLUMNS[table] else name
+                    for name in names
+                ]
+                conn.execute(f"INSERT INTO {table} ({', '.join(names)}) SELECT {', '.join(values)} FROM {table}_rubles")
+                conn.execute(f"DROP TABLE {table}_rubles")
+            for statement in statements:
+                conn.execute(statement)
+        logging.warning(f"Migrated money columns of {', '.join(legacy)} to integer kopecks")
+
+    @staticmethod
+    def _checkpoint(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM journal_checkpoint").fetchone()[0]
+
+    def _compact(self, conn: sqlite3.Connection, force: bool = False):
+        # Журнал обнуляется, только когда база догнала его и сама лежит на диске
+        committed = self._checkpoint(conn)
+        if force or self.journal.wants_compaction(committed):
+            conn.execute("PRAGMA wal_checkpoint(FULL)")
+            self.journal.compact(committed, force)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Чтение при старте
+
+    def load(self) -> dict:
+        """Возвращает сохранённые столы, открытые сессии с заказами, склад и незакончившиеся брони."""
+        conn = self._connect()
+        try:
+            tables = conn.execute(
+                "SELECT number, status, client_name, tariff FROM tables ORDER BY number"
+            ).fetchall()
+            # Читаются только незакрытые сессии (частичный индекс), а не вся история
+            sessions = {
+                row[1]: {"id": row[0], "client_name": row[2], "started_at": datetime.datetime.fromisoformat(row[3]), "products": []}
+                for row in conn.execute(
+                    "SELECT id, table_number, client_name, started_at FROM sessions WHERE ended_at IS NULL"
+                )
+            }
+            by_id = {s["id"]: s for s in sessions.values()}
+            if by_id:
+                placeholders = ",".join("?" * len(by_id))
+                for session_id, name, price in conn.execute(
+                    f"SELECT session_id, name, price FROM order_lines WHERE session_id IN ({placeholders}) ORDER BY id",
+                    list(by_id),
+                ):
+                    by_id[session_id]["products"].append({"name": name, "price": price})
+            inventory = {
+                row[0]: {"name": row[0], "price": row[1], "stock": row[2], "category": row[3]}
+                for row in conn.execute("SELECT name, price, stock, category FROM inventory")
+            }
+            reservations = [
+                {"id": row[0], "table": row[1], "customer": row[2], "phone": row[3],
+                 "start": datetime.datetime.fromisoformat(row[4]), "end": datetime.datetime.fromisoformat(row[5])}
+                for row in conn.execute(
+                    "SELECT id, table_number, customer, phone, starts_at, ends_at FROM reservations "
+                    "WHERE cancelled_at IS NULL AND ends_at > ?",
+                    (datetime.datetime.now().isoformat(),),
+                )
+            ]
+        finally:
+            conn.close()
+        return {"tables": tables, "sessions": sessions, "inventory": inventory, "reservations": reservations}
+
+    def sold_lines(self, first: datetime.date, last: datetime.date) -> tuple:
+        """Названия и цены позиций оплаченных сессий за дни first..last - два столбца для отчётов."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT o.name, o.price FROM order_lines o JOIN sessions s ON s.id = o.session_id "
+                "WHERE s.total IS NOT NULL AND s.ended_at >= ? AND s.ended_at < ?",
+                (first.isoformat(), (last + datetime.timedelta(days=1)).isoformat()),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [name for name, _ in rows], [price for _, price in rows]
+
+    # Запись через очередь
+
+    def _enqueue(self, operation: str, params: tuple = ()):
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.append((operation, params))
+        else:
+            self._put([(operation, params)])
+
+    def _put(self, operations: list):
+        if self._closed:
+            return
+        with self._enqueue_lock:
+            seq = self.journal.append(operations) if self.journal is not None else 0
+            self._queue.put((seq, operations))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Операции внутри блока уходят писателю одним элементом очереди и фиксируются вместе.
+
+        Вложенный блок входит во внешний. Собранное отправляется и при
+        исключении: в памяти изменения уже сделаны, база не должна отстать.
+        """
+        if getattr(self._local, "pending", None) is not None:
+            yield
+            return
+        self._local.pending = []
+        try:
+            yield
+        finally:
+            pending, self._local.pending = self._local.pending, None
+            if pending:
+                self._put(pending)
+
+    def save_table(self, table):
+        self._enqueue(
+            "save_table",
+            (table.number, table.status.name, table.client_name, table.tariff_key),
+        )
+
+    def delete_table(self, number: int):
+        self._enqueue("delete_table", (number,))
+
+    def start_session(self, table) -> int:
+        with self._id_lock:
+            session_id = self._next_session_id
+            self._next_session_id += 1
+        self._enqueue(
+            "start_session",
+            (session_id, table.number, table.client_name, table.start_time.isoformat()),
+        )
+        return session_id
+
+    def end_session(self, session_id: int, ended_at: datetime.datetime, total: Optional[int] = None):
+        self._enqueue(
+            "end_session",
+            (ended_at.isoformat(), total, session_id),
+        )
+
+    def add_order_line(self, session_id: int, name: str, price: int):
+        self._enqueue(
+            "add_order_line",
+            (session_id, name, price, datetime.datetime.now().isoformat()),
+        )
+
+    def add_reservation(self, table: int, start: datetime.datetime, end: datetime.datetime,
+                        customer: str = "", phone: str = "") -> int:
+        with self._id_lock:
+            reservation_id = self._next_reservation_id
+            self._next_reservation_id += 1
+        self._enqueue(
+            "add_reservation",
+            (reservation_id, table, customer, phone, start.isoformat(), end.isoformat()),
+        )
+        return reservation_id
+
+    def cancel_reservation(self, reservation_id: int):
+        self._enqueue(
+            "cancel_reservation",
+            (datetime.datetime.now().isoformat(), reservation_id),
+        )
+
+    def save_product(self, product: dict):
+        self._enqueue(
+            "save_product",
+            (product["name"], product["price"], product["stock"], product["category"]),
+        )
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        waiters = []
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = []
+            # Собираем всё, что накопилось за интервал, в одну транзакцию; ожидающий flush() фиксирует пачку сразу
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+            if batch:
+                self._commit(conn, batch)
+                if self.journal is not None:
+                    self._compact(conn, force=stopping)
+            for waiter in waiters:
+                waiter.set()
+            waiters.clear()
+        conn.close()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Ждёт, пока писатель зафиксирует всё, что было в очереди на момент вызова."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _commit(self, conn: sqlite3.Connection, batch):
+        # Элемент очереди - номер в журнале и операции одной транзакции transaction()
+        try:
+            with conn:
+                for _, operations in batch:
+                    for operation, params in operations:
+                        conn.execute(STATEMENTS[operation], params)
+                # Номер фиксируется вместе с операциями: повтор журнала их не задвоит
+                conn.execute(CHECKPOINT, (batch[-1][0],))
+        except sqlite3.Error as e:
+            logging.error(f"Error writing {len(batch)} storage operations: {e}")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        if self.journal is not None:
+            self.journal.close()